@@ -1,21 +1,48 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from main import *
 from pydantic import BaseModel
 from util import Database
 from registration import UserRegistration
-from models import RegisterItem, LoginItem, PlayerModel, PoissonDist
-from nba_api.live.nba.endpoints import scoreboard
+from models import RegisterItem, LoginItem, PlayerModel, PoissonDist, PoissonBatch, PlayerGamesBatch, SlateProjectionRequest
+from scoreboard_service import ScoreboardService
+from model_registry import model_registry
+from botocore.exceptions import ClientError
 from nba_api.stats.endpoints import CommonTeamRoster
-from nba_api.stats.static import teams, players
+from identity import find_player, find_team
+from connections import WarehousePool
+from cache import GenerationalCache
+from warehouse import get_data_version
+from teams import TEAM_DEFENSE_PROFILE_COLUMNS
+from serialization import ResponseFormat, game_log_frame, keyed_records, frame_response, json_response
+from probabilities import poisson_engine
+from projections import slate_from_scoreboard, slate_for_date, slate_players, opponent_features, project_slate
+from contextlib import asynccontextmanager
 import os
 from datetime import datetime
 import duckdb
+import numpy as np
 
 MOTHERDUCK_TOKEN = os.environ.get('motherduck_token')
 
-app = FastAPI()
+# Shared by every request handler. API_SERVING_MODE=replica reads the local replica instead of MotherDuck
+warehouse_pool = WarehousePool.from_env()
+scoreboard_service = ScoreboardService.from_env()
+
+@asynccontextmanager
+async def lifespan(app : FastAPI):
+    # Pay the warehouse handshake once at startup instead of on every request
+    warehouse_pool.open()
+    scoreboard_service.start()
+    # Load MODEL_PRELOAD models before serving and revalidate them in the background
+    model_registry.start()
+    yield
+    model_registry.stop()
+    scoreboard_service.stop()
+    warehouse_pool.close()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,6 +54,15 @@ app.add_middleware(
 
 security = HTTPBearer()
 
+def read_data_version() -> int:
+    with warehouse_pool.cursor() as conn:
+        return get_data_version(conn)
+
+# Stat endpoints only change when the pipeline bumps the data version, see GenerationalCache
+response_cache = GenerationalCache(read_data_version, max_bytes=int(os.environ.get('API_CACHE_MAX_MB', '64')) * 1024 * 1024)
+# Most (mean, line) pairs one /poisson-batch request may price, a grid allocates means x lines rows
+POISSON_BATCH_MAX_PAIRS = int(os.environ.get('POISSON_BATCH_MAX_PAIRS', '100000'))
+
 # Initialize UserRegistration class
 user_service = UserRegistration()
 
@@ -60,9 +96,42 @@ def points_prediction(player_name: str,item: PlayerModel):
     Takes player name, opponent city, and minutes as inputs.
     Returns predicted points
     """
-    prediction = predict_result(f'{player_name}_points_model.sav', item.opp_city, item.minutes)
-    print(prediction)
-    return {"projected_points": prediction[0][0]}
+    model_filename = f'{player_name}_points_model.sav'
+    try:
+        with warehouse_pool.cursor() as conn:
+            prediction = predict_result_polars(model_filename, item.opp_city, item.minutes, conn)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ClientError:
+        raise HTTPException(status_code=404, detail=f"No points model for player: {player_name}")
+    # Models trained by run_ridge_model predict a 1-D array, older ones a column
+    return {"projected_points": float(np.ravel(prediction)[0])}
+
+@app.post("/slate-projections")
+def slate_projections(item : SlateProjectionRequest):
+    """
+    Projects points for every player on both rosters of every game of a slate, with Poisson
+    under/over probabilities against the given book lines (by player name).
+    Uses today's scoreboard snapshot unless a game_date (YYYY-MM-DD) is given.
+    """
+    if item.game_date is None:
+        games, _, _ = scoreboard_service.snapshot()
+        if games is None:
+            raise HTTPException(status_code=503, detail="Scoreboard not available yet")
+        slate_df = slate_from_scoreboard(games)
+    else:
+        try:
+            slate_df = slate_for_date(item.game_date)
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Could not get games for {item.game_date}: {e}")
+    if slate_df.is_empty():
+        return json_response({'projections': [], 'skipped': []})
+
+    with warehouse_pool.cursor() as conn:
+        players_df = slate_players(conn, slate_df, item.last_number_of_games)
+        features_df = opponent_features(conn)
+    projections_df, skipped = project_slate(players_df, features_df, model_registry, item.lines)
+    return json_response({'projections': projections_df.to_dicts(), 'skipped': skipped})
 
 @app.post("/poisson_dist")
 def get_poisson_dist(poissondist : PoissonDist):
@@ -70,10 +139,28 @@ def get_poisson_dist(poissondist : PoissonDist):
     Convert possion percentages into odds
     """
     data = poissondist.model_dump()
-    proj_points = round(data['predictedPoints'])
-    less_than, greater_than = poisson_dist(data['bookLine'], proj_points)
+    less_than, greater_than = poisson_dist(data['bookLine'], data['predictedPoints'])
     return {"less": less_than, "greater":greater_than }
 
+@app.post("/poisson-batch")
+def poisson_batch(batch : PoissonBatch, format : ResponseFormat = 'columnar') -> Response:
+    """
+    Under/push/over probabilities and fair odds for many props in one request.
+
+    means and lines are paired up one to one (a slate of props), or with grid=true every mean
+    is priced against every line. quantize=true serves every mean from the CDF table.
+    At most POISSON_BATCH_MAX_PAIRS pairs are priced per request.
+    """
+    if not batch.grid and len(batch.means) != len(batch.lines):
+        raise HTTPException(status_code=422, detail=f"Got {len(batch.means)} means and {len(batch.lines)} lines, pass as many of each or grid=true")
+    pairs = len(batch.means) * len(batch.lines) if batch.grid else len(batch.means)
+    if pairs > POISSON_BATCH_MAX_PAIRS:
+        raise HTTPException(status_code=422, detail=f"{pairs} pairs requested, at most {POISSON_BATCH_MAX_PAIRS} per request")
+    means, lines = np.asarray(batch.means), np.asarray(batch.lines)
+    if batch.grid:
+        means = means[:, None]
+    return frame_response(poisson_engine.price(means, lines, batch.quantize), format)
+
 @app.get("/opponent-team-stats/{city}/{number_of_days}")
 def opponent_team_stats(city: str, number_of_days : str):
     """
@@ -124,123 +211,169 @@ class PlayerGamesResponse(BaseModel):
     games: dict[str, GameStats]
 
 @app.get("/player-last-{last_number_of_games}-games/{name}")
-def get_player_last_x_games(name: str, last_number_of_games : int) -> dict[str, dict[str, float]]:
+def get_player_last_x_games(name: str, last_number_of_games : int, format : ResponseFormat = 'json') -> Response:
+    """
+    Player's last N games keyed by GAME_DATE, or as columns / Arrow IPC with ?format=columnar|arrow.
+    """
     try:
         player = Player(name)
-        query = f"SELECT GAME_DATE,PTS,AST,REB,FG3M,MIN FROM player_boxscores WHERE Player_ID = '{player.id}' Order by game_id DESC LIMIT {last_number_of_games}"
-        with duckdb.connect(f"md:nba_data?motherduck_token={MOTHERDUCK_TOKEN}") as conn:
-            player_game_logs = conn.sql(query).pl()
-            response = {}
-            for row in player_game_logs.iter_rows(named=True):
-                game_date = row['GAME_DATE']
-                response[game_date] = {
-                    'points': float(row['PTS']),
-                    'assists': float(row['AST']),
-                    'rebounds': float(row['REB']),
-                    'threePointersMade': float(row['FG3M']),
-                    'minutes': float(row['MIN'])
-                }
-        if not response:
-            raise HTTPException(
-                status_code=404,
-                detail=f"No games found for {player.name}"
-            )
-            
+        def load():
+            query = f"SELECT GAME_DATE,PTS,AST,REB,FG3M,MIN FROM player_boxscores WHERE Player_ID = '{player.id}' Order by game_id DESC LIMIT {last_number_of_games}"
+            with warehouse_pool.cursor() as conn:
+                player_game_logs = game_log_frame(conn.sql(query).pl())
+            if player_game_logs.is_empty():
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"No games found for {player.name}"
+                )
+            return player_game_logs
+        player_game_logs = response_cache.get_or_compute('player-last-games', {'player_id': player.id, 'games': last_number_of_games}, load)
+
     except ValueError:
         raise HTTPException(status_code=404, detail=f"Invalid Player: {name}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
         
-    return response
+    return frame_response(player_game_logs, format, key='GAME_DATE')
 
+@app.post("/player-last-games")
+def get_players_last_x_games(batch : PlayerGamesBatch, format : ResponseFormat = 'json') -> Response:
+    """
+    Last N games of many players (names or ids) in one request.
 
-@app.get("/scoreboard") # Cache until midnight
-def get_scoreboard():
-    games = scoreboard.ScoreBoard().games.get_dict()
-    response = {}
-    for game in games:
-        response[game['gameId']] = {
-            'home_team': game['homeTeam']['teamCity'] + ' ' + game['homeTeam']['teamName'],
-            'away_team': game['awayTeam']['teamCity'] + ' ' + game['awayTeam']['teamName']
-        }
-    return response
+    Players already in the response cache are served from it, the rest are fetched with a
+    single windowed query. Unknown players are listed under not_found instead of failing
+    the whole batch. With ?format=arrow every player's games come back as one Arrow IPC
+    table with a PLAYER column.
+    """
+    generation = response_cache.current_generation()
+    games = {}
+    not_found = []
+    missing = {}
+    for requested in batch.players:
+        try:
+            player_id = find_player(requested).id
+        except ValueError:
+            not_found.append(requested)
+            continue
+        cached = response_cache.get('player-last-games', {'player_id': player_id, 'games': batch.last_number_of_games})
+        if cached is not None:
+            games[str(requested)] = cached
+        else:
+            missing.setdefault(player_id, []).append(str(requested))
+
+    if missing:
+        with warehouse_pool.cursor() as conn:
+            player_game_logs = conn.execute("""
+                SELECT Player_ID, GAME_DATE, PTS, AST, REB, FG3M, MIN
+                FROM player_boxscores
+                WHERE Player_ID IN (SELECT UNNEST(?::BIGINT[]))
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY Player_ID ORDER BY Game_ID DESC) <= ?
+                ORDER BY Player_ID, Game_ID DESC
+            """, [list(missing), batch.last_number_of_games]).pl()
+        for (player_id,), player_games in player_game_logs.partition_by('Player_ID', as_dict=True, maintain_order=True).items():
+            player_games = game_log_frame(player_games)
+            response_cache.put('player-last-games', {'player_id': player_id, 'games': batch.last_number_of_games}, player_games, generation)
+            for requested in missing.pop(player_id, []):
+                games[requested] = player_games
+        # Players with no games in player_boxscores
+        for requested_names in missing.values():
+            for requested in requested_names:
+                games[requested] = game_log_frame(player_game_logs.clear())
+
+    if format == 'arrow':
+        frames = [player_games.with_columns(pl.lit(requested).alias('PLAYER')) for requested, player_games in games.items()]
+        return frame_response(pl.concat(frames) if frames else pl.DataFrame(), format)
+    if format == 'columnar':
+        return json_response({'games': {requested: player_games.to_dict(as_series=False) for requested, player_games in games.items()}, 'not_found': not_found})
+    return json_response({'games': {requested: keyed_records(player_games, 'GAME_DATE') for requested, player_games in games.items()}, 'not_found': not_found})
+
+@app.get("/scoreboard")
+def get_scoreboard(response : Response):
+    """
+    Today's games from the scoreboard service's last snapshot, never from upstream directly.
+    """
+    games, fetched_at, stale = scoreboard_service.snapshot()
+    if games is None:
+        raise HTTPException(status_code=503, detail="Scoreboard not available yet")
+    response.headers['X-Scoreboard-Fetched-At'] = fetched_at.isoformat()
+    response.headers['X-Scoreboard-Stale'] = str(stale).lower()
+    return games
+
+@app.get("/warehouse-pool-stats")
+def get_warehouse_pool_stats():
+    """
+    Checkouts, reconnects and pool wait-time percentiles of the warehouse connection pool.
+    """
+    return warehouse_pool.stats()
+
+@app.get("/model-registry-stats")
+def get_model_registry_stats():
+    """
+    Models held in memory and the registry's hit, load, reload and eviction counts.
+    """
+    return model_registry.stats()
+
+@app.get("/response-cache-stats")
+def get_response_cache_stats():
+    """
+    Generation, size and hit/miss counts of the stat endpoint response cache.
+    """
+    return response_cache.stats()
 
 @app.get("/{team_name}-defense-stats")
 def get_team_defense_stats(team_name : str):
-    team_id = (teams.find_teams_by_full_name(team_name)[0])['id']
+    try:
+        team_id = find_team(team_name).id
+    except ValueError:
+        raise HTTPException(status_code=404, detail=f"Invalid team: {team_name}")
     response = {}
-    with duckdb.connect(f"md:nba_data?motherduck_token={MOTHERDUCK_TOKEN}") as conn:
-        opponent_query = f"SELECT * FROM teams_opponent_stats WHERE TEAM_ID = '{team_id}'"
-        defense_query = f"SELECT * FROM teams_defense_stats WHERE TEAM_ID = '{team_id}'"
-        four_factors_query = f"SELECT * FROM teams_four_factors_stats WHERE TEAM_ID = '{team_id}'"
-        advanced_query = f"SELECT * FROM teams_advanced_stats WHERE TEAM_ID = '{team_id}'"
-        opponent_stats = conn.sql(opponent_query).pl()
-        defense_stats = conn.sql(defense_query).pl()
-        four_factors_stats = conn.sql(four_factors_query).pl()
-        advanced_stats = conn.sql(advanced_query).pl()
-        response[team_name] = {
-            "OPP_FGA_RANK": opponent_stats['OPP_FGA_RANK'][0],
-            "OPP_FGA": opponent_stats['OPP_FGA'][0],
-            "OPP_FG_PCT_RANK": opponent_stats['OPP_FG_PCT_RANK'][0],
-            "OPP_FG_PCT": opponent_stats['OPP_FG_PCT'][0],
-            "OPP_FTA_RANK": opponent_stats['OPP_FTA_RANK'][0],
-            "OPP_FTA": opponent_stats['OPP_FTA'][0],
-            "OPP_FT_PCT_RANK": opponent_stats['OPP_FT_PCT_RANK'][0],
-            "OPP_FT_PCT": opponent_stats['OPP_FT_PCT'][0],
-            "OPP_REB_RANK": opponent_stats['OPP_REB_RANK'][0],
-            "OPP_REB": opponent_stats['OPP_REB'][0],
-            "OPP_AST_RANK": opponent_stats['OPP_AST_RANK'][0],
-            "OPP_AST": opponent_stats['OPP_AST'][0],
-            "OPP_FG3A_RANK": opponent_stats['OPP_FG3A_RANK'][0],
-            "OPP_FG3A": opponent_stats['OPP_FG3A'][0],
-            "DEF_RATING_RANK": defense_stats['DEF_RATING_RANK'][0],
-            "DEF_RATING": defense_stats['DEF_RATING'][0],
-            "OPP_PTS_PAINT_RANK": defense_stats['OPP_PTS_PAINT_RANK'][0],
-            "OPP_PTS_PAINT": defense_stats['OPP_PTS_PAINT'][0],
-            "PACE_RANK": advanced_stats['PACE_RANK'][0],
-            "PACE": advanced_stats['PACE'][0],
-            "OPP_EFG_PCT_RANK": four_factors_stats['OPP_EFG_PCT_RANK'][0],
-            "OPP_EFG_PCT": four_factors_stats['OPP_EFG_PCT'][0],
-            "OPP_FTA_RATE_RANK": four_factors_stats['OPP_FTA_RATE_RANK'][0],
-            "OPP_FTA_RATE": four_factors_stats['OPP_FTA_RATE'][0],
-            "OPP_OREB_PCT_RANK": four_factors_stats['OPP_OREB_PCT_RANK'][0],
-            "OPP_OREB_PCT": four_factors_stats['OPP_OREB_PCT'][0]
-        }
-    return response
+    response[team_name] = response_cache.get_or_compute('defense-stats', {'team_id': team_id}, lambda: load_team_defense_stats(team_id))
+    return json_response(response)
+
+def load_team_defense_stats(team_id : int) -> dict:
+    columns = [column for alias_columns in TEAM_DEFENSE_PROFILE_COLUMNS.values() for column in alias_columns]
+    with warehouse_pool.cursor() as conn:
+        row = conn.execute(f"SELECT {', '.join(columns)} FROM team_defense_profile WHERE TEAM_ID = ?", [team_id]).fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"No defense stats found for team: {team_id}")
+    return dict(zip(columns, row))
+
+SHOOTING_SPLITS_COLUMNS = ['FG2A', 'FG2M', 'FG2_PCT', 'FG3A', 'FG3M', 'FG3_PCT', 'FGA', 'FGM', 'FG_PCT', 'EFG_PCT', 'FG2A_FREQUENCY', 'FG3A_FREQUENCY']
+HEADLINE_STATS_COLUMNS = ['PTS', 'AST', 'REB']
+
+def load_player_row(table_name : str, columns : list[str], player_id : int) -> dict:
+    """
+    Projects just the served columns of a player's row, as plain Python values.
+    """
+    with warehouse_pool.cursor() as conn:
+        row = conn.execute(f"SELECT {', '.join(columns)} FROM {table_name} WHERE PLAYER_ID = ?", [player_id]).fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"No {table_name} found for player: {player_id}")
+    return dict(zip(columns, row))
 
 @app.get("/{player_name}-shooting-splits")
 def get_player_shooting_splits(player_name : str):
-    player_id = (players.find_players_by_full_name(player_name)[0])['id']
+    try:
+        player_id = find_player(player_name).id
+    except ValueError:
+        raise HTTPException(status_code=404, detail=f"Invalid Player: {player_name}")
     response = {}
-    with duckdb.connect(f"md:nba_data?motherduck_token={MOTHERDUCK_TOKEN}") as conn:
-        query = f"SELECT * FROM player_shooting_splits WHERE PLAYER_ID = '{player_id}'"
-        shooting_splits = conn.sql(query).pl()
-        response[player_name] = {
-            "FG2A":shooting_splits['FG2A'][0],
-            "FG2M":shooting_splits['FG2M'][0], 
-            "FG2_PCT":shooting_splits['FG2_PCT'][0],
-            "FG3A":shooting_splits['FG3A'][0],
-            "FG3M":shooting_splits['FG3M'][0],
-            "FG3_PCT":shooting_splits['FG3_PCT'][0],
-            "FGA":shooting_splits['FGA'][0],
-            "FGM":shooting_splits['FGM'][0],
-            "FG_PCT":shooting_splits['FG_PCT'][0],
-            "EFG_PCT":shooting_splits['EFG_PCT'][0],
-            "FG2A_FREQUENCY":shooting_splits['FG2A_FREQUENCY'][0],
-            "FG3A_FREQUENCY":shooting_splits['FG3A_FREQUENCY'][0]
-        }
-        return response
+    response[player_name] = response_cache.get_or_compute('shooting-splits', {'player_id': player_id}, lambda: load_player_shooting_splits(player_id))
+    return json_response(response)
+
+def load_player_shooting_splits(player_id : int) -> dict:
+    return load_player_row('player_shooting_splits', SHOOTING_SPLITS_COLUMNS, player_id)
     
 @app.get("/{player_name}-headline-stats")
 def get_player_headline_stats(player_name : str):
-    player_id = (players.find_players_by_full_name(player_name)[0])['id']
+    try:
+        player_id = find_player(player_name).id
+    except ValueError:
+        raise HTTPException(status_code=404, detail=f"Invalid Player: {player_name}")
     response = {}
-    with duckdb.connect(f"md:nba_data?motherduck_token={MOTHERDUCK_TOKEN}") as conn:
-        query = f"SELECT * FROM player_headline_stats WHERE PLAYER_ID = '{player_id}'"
-        shooting_splits = conn.sql(query).pl()
-        response[player_name] = {
-            "PTS":shooting_splits['PTS'][0],
-            "AST":shooting_splits['AST'][0], 
-            "REB":shooting_splits['REB'][0]
-        }
-        return response
+    response[player_name] = response_cache.get_or_compute('headline-stats', {'player_id': player_id}, lambda: load_player_headline_stats(player_id))
+    return json_response(response)
+
+def load_player_headline_stats(player_id : int) -> dict:
+    return load_player_row('player_headline_stats', HEADLINE_STATS_COLUMNS, player_id)
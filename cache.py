@@ -0,0 +1,256 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+# Endpoint params that change how a request is made, not what it returns
+TRANSPORT_PARAMS = {'timeout', 'proxy', 'headers', 'get_request'}
+
+# Seconds a cached response stays fresh, per nba_api endpoint class name
+DEFAULT_TTLS = {
+    'CommonTeamRoster': 6 * 60 * 60,
+    'CommonPlayerInfo': 12 * 60 * 60,
+    'LeagueDashTeamStats': 60 * 60,
+    'LeagueGameLog': 60 * 60,
+    'PlayerGameLog': 60 * 60,
+    'PlayerDashPtShots': 60 * 60,
+    'TeamGameLogs': 60 * 60,
+}
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of raw endpoint payloads.
+
+    Entries are keyed on the endpoint name plus its normalized parameters and stored as
+    zlib-compressed JSON, so the API server and pipeline processes share warm keys. Each
+    endpoint has its own TTL, and the least recently used entries are evicted once the
+    directory grows past max_bytes.
+
+    Parameters:
+        directory (str): where cached payloads are written
+        max_bytes (int): size bound for the whole cache directory
+        ttls (dict[str, int]): seconds to keep each endpoint's responses, 0 disables caching it
+        default_ttl (int): TTL for endpoints not in ttls
+    """
+    def __init__(self, directory : str, max_bytes : int = 256 * 1024 * 1024, ttls : dict[str, int] = None, default_ttl : int = 60 * 60) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(size for _, size, _ in self._entries())
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        """
+        Builds a cache from NBA_API_CACHE_DIR and NBA_API_CACHE_MAX_MB.
+        """
+        return cls(
+            directory=os.environ.get('NBA_API_CACHE_DIR', '.nba_api_cache'),
+            max_bytes=int(os.environ.get('NBA_API_CACHE_MAX_MB', '256')) * 1024 * 1024,
+        )
+
+    @staticmethod
+    def key(endpoint_name : str, params : dict) -> str:
+        """
+        Hash of the endpoint name and its request parameters, independent of argument order.
+        """
+        normalized = {k: str(v) for k, v in params.items() if k not in TRANSPORT_PARAMS and v is not None}
+        payload = json.dumps([endpoint_name, normalized], sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def ttl(self, endpoint_name : str) -> int:
+        return self.ttls.get(endpoint_name, self.default_ttl)
+
+    def _path(self, key : str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json.z")
+
+    def _entries(self):
+        """
+        Yields (path, size, last_access) for every cached payload on disk.
+        """
+        for root, _, files in os.walk(self.directory):
+            for file in files:
+                if file.endswith('.json.z'):
+                    path = os.path.join(root, file)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, stat.st_size, stat.st_atime
+
+    def get(self, endpoint_name : str, params : dict) -> dict | None:
+        """
+        Returns the cached payload, or None when missing or older than the endpoint's TTL.
+        """
+        ttl = self.ttl(endpoint_name)
+        if ttl <= 0:
+            return None
+        path = self._path(self.key(endpoint_name, params))
+        try:
+            stat = os.stat(path)
+            if time.time() - stat.st_mtime > ttl:
+                raise FileNotFoundError(path)
+            with open(path, 'rb') as f:
+                data = json.loads(zlib.decompress(f.read()))
+            # Access time drives LRU eviction, mtime keeps tracking when the entry was written
+            os.utime(path, (time.time(), stat.st_mtime))
+        except (FileNotFoundError, zlib.error, ValueError):
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return data
+
+    def put(self, endpoint_name : str, params : dict, data : dict):
+        """
+        Stores a payload, evicting least recently used entries if the cache is over its size bound.
+        """
+        if self.ttl(endpoint_name) <= 0:
+            return
+        path = self._path(self.key(endpoint_name, params))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        blob = zlib.compress(json.dumps(data).encode('utf-8'))
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.size += len(blob)
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Rescan so entries written by other processes are accounted for
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self.size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+            self.evictions += 1
+        logging.info(f"Evicted cached responses down to {self.size} bytes")
+
+    def stats(self) -> dict[str, int]:
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'bytes': self.size}
+
+    def clear(self):
+        with self.lock:
+            for path, _, _ in list(self._entries()):
+                os.remove(path)
+            self.size = 0
+
+
+class GenerationalCache:
+    """
+    In-memory LRU of API responses, invalidated when the warehouse data version changes.
+
+    Entries are keyed on the endpoint name plus its normalized parameters and tagged with
+    the data generation they were computed from. The current generation is read with
+    generation_fn at most every check_interval seconds, so warm requests don't touch the
+    warehouse at all; once the pipeline bumps the version every older entry misses.
+
+    Parameters:
+        generation_fn: returns the current data generation (e.g. warehouse.get_data_version)
+        max_bytes (int): approximate size bound of the cached responses, as JSON
+        check_interval (float): seconds between generation checks
+
+    Example:
+        cache = GenerationalCache(lambda: get_data_version(conn))
+        cache.get_or_compute('headline-stats', {'player': 'lebron james'}, load_headline_stats)
+    """
+    def __init__(self, generation_fn, max_bytes : int = 64 * 1024 * 1024, check_interval : float = 60.0) -> None:
+        self.generation_fn = generation_fn
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self.entries = OrderedDict()
+        self.size = 0
+        self.generation = None
+        self.checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def current_generation(self):
+        now = time.monotonic()
+        if self.generation is None or now - self.checked_at > self.check_interval:
+            try:
+                generation = self.generation_fn()
+            except Exception as e:
+                # Keep serving the last known generation rather than failing every request
+                logging.error(f"Error reading data generation: {e}")
+                generation = self.generation
+            with self.lock:
+                if generation != self.generation:
+                    self.entries.clear()
+                    self.size = 0
+                self.generation = generation
+                self.checked_at = now
+        return self.generation
+
+    def get(self, endpoint_name : str, params : dict):
+        """
+        Returns the cached response for the current generation, None on a miss.
+        """
+        generation = self.current_generation()
+        key = ResponseCache.key(endpoint_name, params)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == generation:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        return None
+
+    def put(self, endpoint_name : str, params : dict, value, generation = None):
+        """
+        Stores a response computed from `generation` (default: the current one), evicting
+        least recently used entries once the cache is over its size bound.
+        """
+        key = ResponseCache.key(endpoint_name, params)
+        # DataFrames report their own size, anything else is measured as JSON
+        size = value.estimated_size() if hasattr(value, 'estimated_size') else len(json.dumps(value, default=str))
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[2]
+            self.entries[key] = (self.generation if generation is None else generation, value, size)
+            self.size += size
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, (_, _, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def get_or_compute(self, endpoint_name : str, params : dict, compute):
+        """
+        Returns the cached response for the current generation, computing and storing it on a miss.
+        Exceptions from compute (e.g. 404s) are raised and not cached.
+        """
+        generation = self.current_generation()
+        value = self.get(endpoint_name, params)
+        if value is None:
+            value = compute()
+            self.put(endpoint_name, params, value, generation)
+        return value
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'generation': self.generation, 'entries': len(self.entries), 'bytes': self.size,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
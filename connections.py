@@ -0,0 +1,328 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from queue import Queue
+import duckdb
+import polars as pl
+from replica import replica_path
+
+
+def warehouse_database() -> str:
+    """
+    Database the pipelines write to. WAREHOUSE_DATABASE can point at a local DuckDB file
+    (e.g. 'nba_data.duckdb') to stand in for MotherDuck.
+    """
+    return os.environ.get('WAREHOUSE_DATABASE', f"md:nba_data?motherduck_token={os.environ.get('motherduck_token')}")
+
+
+class TimedCursor:
+    """
+    Wraps a DuckDB cursor and adds the time spent in execute/sql and commit to a task's timings.
+    Every other attribute is forwarded to the cursor.
+    """
+    def __init__(self, cursor, timings : dict) -> None:
+        self.cursor = cursor
+        self.timings = timings
+
+    def _timed(self, bucket : str, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.timings[bucket] += time.perf_counter() - start
+            self.timings[f"{bucket}_count"] += 1
+
+    def execute(self, query : str, parameters=None):
+        return self._timed('query', self.cursor.execute, query, parameters)
+
+    def sql(self, query : str):
+        return self._timed('query', self.cursor.sql, query)
+
+    def commit(self):
+        return self._timed('commit', self.cursor.commit)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+class WarehouseConnectionManager:
+    """
+    Owns one authenticated warehouse connection for a whole flow run and hands tasks cursors on it.
+
+    Cursors share the connection (and its MotherDuck handshake) but have their own transaction
+    state, so concurrent tasks can each hold one. Connect, query and commit time is recorded per
+    task name and can be pulled with report().
+
+    Example:
+        with WarehouseConnectionManager() as warehouse:
+            with warehouse.cursor('populate_team_stats') as conn:
+                team_stats(conn, 'Opponent', 'teams_opponent_stats')
+            print(warehouse.report())
+    """
+    def __init__(self, database : str = None) -> None:
+        self.database = database or warehouse_database()
+        self.conn = None
+        self.lock = threading.RLock()
+        self.timings = {}
+
+    def _task_timings(self, task_name : str) -> dict:
+        with self.lock:
+            return self.timings.setdefault(task_name, {'connect': 0.0, 'connect_count': 0, 'query': 0.0, 'query_count': 0, 'commit': 0.0, 'commit_count': 0})
+
+    def open(self):
+        with self.lock:
+            if self.conn is None:
+                start = time.perf_counter()
+                self.conn = duckdb.connect(self.database)
+                connect_time = time.perf_counter() - start
+                timings = self._task_timings('open_connection')
+                timings['connect'] += connect_time
+                timings['connect_count'] += 1
+                logging.info(f"Opened warehouse connection in {connect_time:.2f}s")
+        return self
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextmanager
+    def cursor(self, task_name : str):
+        """
+        Yields a TimedCursor on the shared connection, closed when the block exits.
+        """
+        self.open()
+        timings = self._task_timings(task_name)
+        start = time.perf_counter()
+        cursor = self.conn.cursor()
+        timings['connect'] += time.perf_counter() - start
+        timings['connect_count'] += 1
+        try:
+            yield TimedCursor(cursor, timings)
+        finally:
+            cursor.close()
+
+    def report(self) -> pl.DataFrame:
+        """
+        Returns connect/query/commit seconds and counts per task, slowest first.
+        """
+        with self.lock:
+            rows = [{'task': task_name, **timings} for task_name, timings in self.timings.items()]
+        if not rows:
+            return pl.DataFrame()
+        return pl.DataFrame(rows).sort('query', descending=True)
+
+
+class WarehousePool:
+    """
+    Long-lived warehouse connection shared by API request handlers, created once at startup.
+
+    The MotherDuck handshake happens once; requests check one of `size` cursors out of a
+    queue, so at most `size` queries run at once and the rest wait their turn. A cursor
+    that has been idle for health_check_after seconds is probed with SELECT 1 before it is
+    handed out; a failed probe reconnects, and a cursor whose query failed is replaced. Checkout wait times
+    are kept for stats().
+
+    A read_only pool on a local file (the replica serving mode) checks on checkout whether the
+    file was swapped by sync_replica and, if so, opens the new file. Requests already running
+    finish on the old snapshot, and cursors on it are replaced as they come back.
+
+    Example:
+        pool = WarehousePool(size=4)
+        with pool.cursor() as conn:
+            conn.execute("SELECT * FROM player_headline_stats").pl()
+    """
+    def __init__(self, database : str = None, size : int = 4, health_check_after : float = 30.0, samples : int = 1000, read_only : bool = False) -> None:
+        self.database = database or warehouse_database()
+        self.read_only = read_only
+        self.snapshot = None
+        self.size = size
+        self.health_check_after = health_check_after
+        self.conn = None
+        self.lock = threading.Lock()
+        self.idle = Queue()
+        self.waits = deque(maxlen=samples)
+        self.checkouts = 0
+        self.reconnects = 0
+        self.failed_checks = 0
+        self.swaps = 0
+
+    @classmethod
+    def from_env(cls) -> "WarehousePool":
+        """
+        Builds a pool of WAREHOUSE_POOL_SIZE cursors (default 4). With API_SERVING_MODE=replica
+        it reads the local replica_path() snapshot read-only, otherwise warehouse_database().
+        """
+        size = int(os.environ.get('WAREHOUSE_POOL_SIZE', '4'))
+        if os.environ.get('API_SERVING_MODE', 'warehouse') == 'replica':
+            return cls(replica_path(), size=size, read_only=True)
+        return cls(size=size)
+
+    def _snapshot_path(self):
+        return os.path.realpath(self.database) if os.path.exists(self.database) else None
+
+    def _connect(self):
+        if not self.read_only:
+            return duckdb.connect(self.database)
+        # Open the snapshot the replica link points at, see sync_replica
+        self.snapshot = self._snapshot_path() or self.database
+        return duckdb.connect(self.snapshot, read_only=True)
+
+    def open(self):
+        with self.lock:
+            if self.conn is None:
+                start = time.perf_counter()
+                self.conn = self._connect()
+                logging.info(f"Opened warehouse pool connection to {'replica ' + self.database if self.read_only else 'warehouse'} in {time.perf_counter() - start:.2f}s")
+                for _ in range(self.size):
+                    self.idle.put((self.conn.cursor(), time.monotonic(), self.conn))
+        return self
+
+    def close(self):
+        with self.lock:
+            while not self.idle.empty():
+                cursor = self.idle.get_nowait()[0]
+                if cursor is not None:
+                    cursor.close()
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def _reconnect(self, broken_conn):
+        """
+        Replaces the shared connection unless another request already did.
+        """
+        with self.lock:
+            if self.conn is broken_conn:
+                logging.warning("Reconnecting warehouse pool connection")
+                try:
+                    self.conn.close()
+                except Exception:
+                    pass
+                self.conn = self._connect()
+                self.reconnects += 1
+            return self.conn
+
+    def _reload_if_swapped(self):
+        """
+        Opens the replica file again if sync_replica moved a new snapshot into place. The old
+        connection isn't closed, requests still using it finish on the previous snapshot.
+        """
+        snapshot = self._snapshot_path()
+        if snapshot is None or snapshot == self.snapshot:
+            return
+        with self.lock:
+            if snapshot != self.snapshot:
+                self.conn = self._connect()
+                self.swaps += 1
+                logging.info(f"Replica {self.database} was swapped, reading {self.snapshot}")
+
+    def _fresh_cursor(self):
+        conn = self.conn
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            return cursor, conn
+        except Exception:
+            conn = self._reconnect(conn)
+            return conn.cursor(), conn
+
+    def _healthy(self, cursor) -> bool:
+        try:
+            cursor.execute("SELECT 1").fetchone()
+            return True
+        except Exception:
+            with self.lock:
+                self.failed_checks += 1
+            return False
+
+    @contextmanager
+    def cursor(self):
+        """
+        Yields a pooled cursor for one request, blocking while every cursor is checked out.
+        """
+        self.open()
+        if self.read_only:
+            self._reload_if_swapped()
+        start = time.perf_counter()
+        cursor, idle_since, cursor_conn = self.idle.get()
+        wait_time = time.perf_counter() - start
+        with self.lock:
+            self.waits.append(wait_time)
+            self.checkouts += 1
+        try:
+            # Cursors on a replaced connection (reconnect or replica swap) are retired
+            if cursor is not None and cursor_conn is not self.conn:
+                cursor.close()
+                cursor = None
+            # An empty slot is left behind when a reconnect failed
+            if cursor is None or (time.monotonic() - idle_since > self.health_check_after and not self._healthy(cursor)):
+                cursor, cursor_conn = self._fresh_cursor()
+        except Exception:
+            self.idle.put((None, 0.0, None))
+            raise
+        try:
+            yield cursor
+        except duckdb.Error:
+            # Don't hand a cursor in an unknown state to the next request
+            cursor.close()
+            cursor = None
+            raise
+        finally:
+            self.idle.put((cursor, time.monotonic(), cursor_conn))
+
+    def stats(self) -> dict:
+        """
+        Returns checkout counts, reconnects and wait-time percentiles in milliseconds.
+        """
+        with self.lock:
+            waits = sorted(self.waits)
+            stats = {'size': self.size, 'idle': self.idle.qsize(), 'checkouts': self.checkouts,
+                     'reconnects': self.reconnects, 'failed_health_checks': self.failed_checks, 'replica_swaps': self.swaps}
+        for name, quantile in (('wait_p50_ms', 0.5), ('wait_p95_ms', 0.95), ('wait_max_ms', 1.0)):
+            stats[name] = waits[min(len(waits) - 1, int(quantile * len(waits)))] * 1e3 if waits else 0.0
+        return stats
+
+
+# Manager of the flow run currently executing, if any
+_active_manager = None
+
+
+@contextmanager
+def flow_connection(database : str = None):
+    """
+    Opens the warehouse connection for a flow run and makes it available to task_cursor().
+    """
+    global _active_manager
+    manager = WarehouseConnectionManager(database)
+    with manager:
+        _active_manager = manager
+        try:
+            yield manager
+        finally:
+            _active_manager = None
+
+
+@contextmanager
+def task_cursor(task_name : str):
+    """
+    Yields a cursor on the running flow's connection, or on a short-lived connection when a
+    task is run on its own outside a flow.
+    """
+    if _active_manager is not None:
+        with _active_manager.cursor(task_name) as cursor:
+            yield cursor
+    else:
+        with WarehouseConnectionManager() as manager:
+            with manager.cursor(task_name) as cursor:
+                yield cursor
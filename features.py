@@ -0,0 +1,241 @@
+import logging
+import time
+import numpy as np
+import polars as pl
+from warehouse import upsert
+from watermarks import WATERMARK_TABLE, GAME_DATE, ensure_watermark_table, filter_new_games, update_watermarks
+from lake import rebuild_table
+from teams import OPPONENT_FEATURES
+
+FEATURE_TABLE = 'player_rolling_features'
+
+# Stats, windows (games, or the season to date) and aggregations computed by default
+ROLLING_STATS = ['MIN', 'PTS', 'AST', 'REB', 'FG3M']
+ROLLING_WINDOWS = [3, 5, 10, 'SEASON']
+ROLLING_AGGREGATIONS = ['MEAN', 'MEDIAN', 'STD', 'EWM']
+
+# More games than a regular season plus playoffs, so a rolling window this long covers a season
+SEASON_GAMES = 120
+
+# Windows of the point-in-time opponent features, named like the opponent_features table columns
+OPPONENT_FORM_WINDOWS = [5, 10, 'SEASON']
+
+
+def feature_name(stat : str, aggregation : str, window : int | str) -> str:
+    """
+    Column name of a rolling feature, e.g. ('MIN', 'MEAN', 3) -> 'MIN_MEAN_L3', ('PTS', 'STD', 'SEASON') -> 'PTS_STD_SEASON'.
+    """
+    return f"{stat}_{aggregation}_{window if window == 'SEASON' else f'L{window}'}"
+
+
+def rolling_feature_exprs(stats : list[str] = ROLLING_STATS, windows : list = ROLLING_WINDOWS, aggregations : list[str] = ROLLING_AGGREGATIONS) -> list[pl.Expr]:
+    """
+    Expressions computing every (stat, window, aggregation) over each player's previous games.
+
+    Features only look at games before the current one (the stat is shifted by one game), so a
+    row can be used to predict its own game. Game windows run across seasons, SEASON windows
+    restart every season. EWM uses the window as its span and has no SEASON variant.
+    """
+    exprs = []
+    for stat in stats:
+        for window in windows:
+            season = window == 'SEASON'
+            size = SEASON_GAMES if season else window
+            partition = ['Player_ID', 'SEASON_ID'] if season else ['Player_ID']
+            prior = pl.col(stat).cast(pl.Float64).shift(1)
+            for aggregation in aggregations:
+                if aggregation == 'MEAN':
+                    expr = prior.rolling_mean(size, min_samples=1)
+                elif aggregation == 'MEDIAN':
+                    expr = prior.rolling_median(size, min_samples=1)
+                elif aggregation == 'STD':
+                    expr = prior.rolling_std(size, min_samples=2)
+                elif aggregation == 'EWM':
+                    if season:
+                        continue
+                    expr = prior.ewm_mean(span=size, min_samples=1, ignore_nulls=True)
+                else:
+                    raise ValueError(f"Unknown rolling aggregation: {aggregation}")
+                exprs.append(expr.over(partition).alias(feature_name(stat, aggregation, window)))
+    return exprs
+
+
+def compute_rolling_features(boxscores_df : pl.DataFrame, stats : list[str] = ROLLING_STATS, windows : list = ROLLING_WINDOWS, aggregations : list[str] = ROLLING_AGGREGATIONS) -> pl.DataFrame:
+    """
+    Computes rolling features for every player in player_boxscores rows in one Polars pass.
+
+    Parameters:
+        boxscores_df (pl.DataFrame): player_boxscores rows (Player_ID, Game_ID, SEASON_ID, GAME_DATE and the stats)
+        stats (list[str]): stat columns to aggregate
+        windows (list): game counts, and/or 'SEASON' for the season to date
+        aggregations (list[str]): any of 'MEAN', 'MEDIAN', 'STD', 'EWM'
+
+    Returns:
+        pl.DataFrame: Game_ID, Player_ID, SEASON_ID, GAME_DATE and one column per feature
+    """
+    return (boxscores_df
+        .with_columns(GAME_DATE.alias('GAME_DAY'))
+        .sort(['Player_ID', 'GAME_DAY', 'Game_ID'])
+        .select(
+            'Game_ID', 'Player_ID', 'SEASON_ID', 'GAME_DATE',
+            *rolling_feature_exprs(stats, windows, aggregations)
+        )
+    )
+
+
+def load_feature_source(conn, full : bool = False) -> pl.DataFrame:
+    """
+    Reads the player_boxscores rows needed to bring the feature table up to date.
+
+    Only players with games after their FEATURE_TABLE watermark are read, from the season
+    before their earliest new game on, which covers every game and season window of those
+    games. With full=True (or on the first build) every row is read.
+    """
+    if full:
+        return conn.execute("SELECT * FROM player_boxscores").pl()
+    ensure_watermark_table(conn)
+    return conn.execute(f"""
+        WITH pending AS (
+            SELECT b.Player_ID, MIN(CAST(RIGHT(b.SEASON_ID, 4) AS INTEGER)) AS FIRST_SEASON
+            FROM player_boxscores b
+            LEFT JOIN {WATERMARK_TABLE} w ON w.TABLE_NAME = ? AND w.PLAYER_ID = b.Player_ID
+            WHERE w.LAST_GAME_DATE IS NULL OR strptime(b.GAME_DATE, '%b %d, %Y')::DATE > w.LAST_GAME_DATE
+            GROUP BY b.Player_ID
+        )
+        SELECT b.*
+        FROM player_boxscores b
+        JOIN pending p ON p.Player_ID = b.Player_ID
+        WHERE CAST(RIGHT(b.SEASON_ID, 4) AS INTEGER) >= p.FIRST_SEASON - 1
+    """, [FEATURE_TABLE]).pl()
+
+
+def build_rolling_features(conn, full : bool = False) -> int:
+    """
+    Brings player_rolling_features up to date with player_boxscores without calling the API.
+
+    Incremental runs compute features for players with new games only and append the new
+    games' rows. full=True recomputes and replaces the whole table, e.g. after player_boxscores
+    was rebuilt or backfilled with games older than the watermarks, which only move forward.
+
+    Parameters:
+        conn: DuckDB connection object
+        full (bool): recompute every row instead of only new games
+
+    Returns:
+        int: number of feature rows written
+    """
+    start = time.perf_counter()
+    source_df = load_feature_source(conn, full)
+    if source_df.is_empty():
+        logging.info(f"{FEATURE_TABLE} is up to date")
+        return 0
+    features_df = compute_rolling_features(source_df)
+    if full:
+        rows = rebuild_table(conn, FEATURE_TABLE, features_df)
+    else:
+        features_df = filter_new_games(conn, FEATURE_TABLE, features_df)
+        rows = upsert(conn, FEATURE_TABLE, features_df)
+    update_watermarks(conn, FEATURE_TABLE, features_df, league=True)
+    conn.commit()
+    logging.info(f"Wrote {rows} {FEATURE_TABLE} rows from {source_df.height} boxscores in {time.perf_counter() - start:.2f}s")
+    return rows
+
+
+def opponent_form(team_df : pl.DataFrame, windows : list = OPPONENT_FORM_WINDOWS) -> pl.DataFrame:
+    """
+    Each team's OPPONENT_FEATURES averaged over its last games and its season to date, as of
+    the end of every game day, from team_boxscores rows.
+
+    Returns:
+        pl.DataFrame: OPPONENT (the team's abbreviation), FORM_DAY, FORM_SEASON and one
+            {feature}_L{n} / {feature}_SEASON column per feature and window
+    """
+    columns = []
+    for window in windows:
+        season = window == 'SEASON'
+        partition = ['TEAM_ABBREVIATION', 'FORM_SEASON'] if season else ['TEAM_ABBREVIATION']
+        for feature in OPPONENT_FEATURES:
+            columns.append(pl.col(feature).cast(pl.Float64)
+                .rolling_mean(SEASON_GAMES if season else window, min_samples=1)
+                .over(partition)
+                .alias(f"{feature}_{window if season else f'L{window}'}"))
+    return (team_df
+        .with_columns(
+            pl.col('GAME_DATE').str.slice(0, 10).str.to_date('%Y-%m-%d').alias('FORM_DAY'),
+            pl.col('SEASON_YEAR').str.slice(0, 4).alias('FORM_SEASON'),
+        )
+        .sort(['TEAM_ABBREVIATION', 'FORM_DAY', 'GAME_ID'])
+        .select(pl.col('TEAM_ABBREVIATION').alias('OPPONENT'), 'FORM_DAY', 'FORM_SEASON', *columns)
+        .sort('FORM_DAY')
+    )
+
+
+def attach_opponent_form(games_df : pl.DataFrame, form_df : pl.DataFrame) -> pl.DataFrame:
+    """
+    Attaches the opponent's form as of the day before each game with one sorted as-of join.
+
+    Every player game gets its OPPONENT's newest opponent_form row from strictly earlier days,
+    so no game sees stats from itself or later games. Season-to-date columns are left null
+    when that row is from an earlier season.
+
+    Parameters:
+        games_df (pl.DataFrame): player_boxscores rows (OPPONENT, GAME_DATE like 'APR 14, 2024', SEASON_ID)
+        form_df (pl.DataFrame): output of opponent_form
+
+    Returns:
+        pl.DataFrame: games_df plus the opponent_form feature columns
+    """
+    season_columns = [column for column in form_df.columns if column.endswith('_SEASON') and column != 'FORM_SEASON']
+    return (games_df
+        .with_columns(GAME_DATE.alias('GAME_DAY'))
+        # Both sides are sorted by day, per opponent sortedness can't be checked so skip it
+        .sort('GAME_DAY')
+        .join_asof(form_df, left_on='GAME_DAY', right_on='FORM_DAY', by='OPPONENT', strategy='backward', allow_exact_matches=False, check_sortedness=False)
+        .with_columns(
+            pl.when(pl.col('FORM_SEASON') == pl.col('SEASON_ID').str.slice(-4)).then(pl.col(column)).alias(column)
+            for column in season_columns
+        )
+        .drop('GAME_DAY', 'FORM_DAY', 'FORM_SEASON')
+    )
+
+
+def point_in_time_opponent_features(conn, games_df : pl.DataFrame = None) -> pl.DataFrame:
+    """
+    Leak-free opponent features for player games, computed in one columnar pass over
+    team_boxscores and attached with attach_opponent_form.
+
+    Parameters:
+        conn: DuckDB connection object
+        games_df (pl.DataFrame): player games to enrich, every player_boxscores row by default
+
+    Returns:
+        pl.DataFrame: games_df plus {feature}_L5, {feature}_L10 and {feature}_SEASON columns
+    """
+    if games_df is None:
+        games_df = conn.execute("SELECT * FROM player_boxscores").pl()
+    team_df = conn.execute(f"SELECT GAME_ID, GAME_DATE, SEASON_YEAR, TEAM_ABBREVIATION, {', '.join(OPPONENT_FEATURES)} FROM team_boxscores").pl()
+    return attach_opponent_form(games_df, opponent_form(team_df))
+
+
+def benchmark(players : int = 500, games : int = 400) -> dict[str, float]:
+    """
+    Seconds to compute the default features for a synthetic league of players x games.
+    """
+    rng = np.random.default_rng(0)
+    rows = players * games
+    day = np.tile(np.arange(games), players)
+    boxscores_df = pl.DataFrame({
+        'Player_ID': np.repeat(np.arange(players), games),
+        'Game_ID': [f"{i:010d}" for i in range(rows)],
+        'SEASON_ID': pl.Series(2 * 10000 + 2015 + day // 82).cast(pl.String),
+        'GAME_DATE': pl.Series(pl.date_range(pl.date(2015, 10, 1), pl.date(2015, 10, 1) + pl.duration(days=games - 1), eager=True).dt.strftime('%b %d, %Y').str.to_uppercase()).gather(day),
+        **{stat: rng.integers(0, 40, rows) for stat in ROLLING_STATS},
+    })
+    start = time.perf_counter()
+    features_df = compute_rolling_features(boxscores_df)
+    return {'rows': rows, 'features': features_df.width - 4, 'seconds': time.perf_counter() - start}
+
+
+if __name__ == "__main__":
+    for measurement, value in benchmark().items():
+        print(f"{measurement}: {value}")
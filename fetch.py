@@ -0,0 +1,270 @@
+import inspect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import polars as pl
+import requests
+from cache import ResponseCache
+
+# HTTP statuses from stats.nba.com worth retrying
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket shared by every upstream request.
+
+    Parameters:
+        rate (float): tokens added per second (the requests-per-second budget)
+        burst (int): maximum number of tokens that can be saved up
+    """
+    def __init__(self, rate : float, burst : int = 1) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Blocks until a token is available. Returns seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+            waited += wait_time
+
+
+class UpstreamStatusError(Exception):
+    """
+    A stats.nba.com response with an error status. nba_api doesn't raise on those, the body
+    (often an HTML error page) only fails later as a JSON decode error.
+    """
+    def __init__(self, status_code : int, url : str) -> None:
+        super().__init__(f"HTTP {status_code} from {url}")
+        self.status_code = status_code
+        self.url = url
+
+
+def call_endpoint(endpoint, params : dict) -> dict:
+    """
+    Calls an endpoint and returns its get_dict() payload, raising UpstreamStatusError for
+    error statuses. nba_api endpoints are built with get_request=False and sent separately,
+    so the status is checked before the body is decoded. Endpoints without that option
+    (e.g. local fakes) are just constructed.
+    """
+    if 'get_request' not in inspect.signature(endpoint).parameters:
+        return endpoint(**params).get_dict()
+    instance = endpoint(**params, get_request=False)
+    try:
+        instance.get_request()
+    except Exception:
+        response = getattr(instance, 'nba_response', None)
+        status = getattr(response, '_status_code', None)
+        if status is not None and status >= 400:
+            raise UpstreamStatusError(status, response.get_url())
+        raise
+    return instance.get_dict()
+
+
+def is_retryable(error : Exception) -> bool:
+    """
+    Timeouts, dropped connections, 429s and 5xx responses are retried, anything else is raised.
+    A body that isn't JSON is retried too: that's how a throttled response looks when its
+    status isn't known.
+    """
+    if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError, json.JSONDecodeError)):
+        return True
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', getattr(error, 'status_code', None))
+    return status in RETRYABLE_STATUS
+
+
+def retry_after(error : Exception) -> float | None:
+    """
+    Seconds requested by a Retry-After header, if the error carries one. nba_api doesn't keep
+    response headers, so its 429s back off with jitter instead.
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers['Retry-After'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class FetchScheduler:
+    """
+    Single entry point for nba_api endpoint calls.
+
+    Every request takes a token from a global RateLimiter and a slot from a per-endpoint
+    semaphore, and failed requests are retried with jittered exponential backoff. Work can
+    be fanned out on a bounded thread pool so concurrency grows to the rate budget instead
+    of being fixed by sleeps.
+
+    When a ResponseCache is attached, fresh cached payloads are returned without spending
+    a token or touching upstream.
+
+    An endpoint is anything constructed with keyword params that exposes get_dict(), so the
+    nba_api endpoint classes and local fake endpoints are interchangeable.
+
+    Parameters:
+        requests_per_second (float): global request budget
+        burst (int): requests allowed back to back before the rate applies
+        max_workers (int): size of the worker pool used by submit/map
+        endpoint_limits (dict[str, int]): max in-flight requests per endpoint class name
+        default_endpoint_limit (int): cap for endpoints not in endpoint_limits
+        max_retries (int): attempts per request before giving up
+        base_wait (float): first backoff window in seconds
+        max_wait (float): largest backoff window in seconds
+        cache (ResponseCache): optional response cache consulted before each request
+    """
+    def __init__(self, requests_per_second : float = 1.0, burst : int = 1, max_workers : int = 4,
+                 endpoint_limits : dict[str, int] = None, default_endpoint_limit : int = 2,
+                 max_retries : int = 3, base_wait : float = 2, max_wait : float = 60, cache : ResponseCache = None) -> None:
+        self.limiter = RateLimiter(requests_per_second, burst)
+        self.max_workers = max_workers
+        self.endpoint_limits = endpoint_limits or {}
+        self.default_endpoint_limit = default_endpoint_limit
+        self.max_retries = max_retries
+        self.base_wait = base_wait
+        self.max_wait = max_wait
+        self.cache = cache
+        self._semaphores = {}
+        self._semaphores_lock = threading.Lock()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "FetchScheduler":
+        """
+        Builds a scheduler from NBA_API_RPS, NBA_API_BURST, NBA_API_WORKERS and NBA_API_RETRIES.
+        The response cache is on unless NBA_API_CACHE=0.
+        """
+        cache = ResponseCache.from_env() if os.environ.get('NBA_API_CACHE', '1') != '0' else None
+        return cls(
+            requests_per_second=float(os.environ.get('NBA_API_RPS', '1')),
+            burst=int(os.environ.get('NBA_API_BURST', '1')),
+            max_workers=int(os.environ.get('NBA_API_WORKERS', '4')),
+            max_retries=int(os.environ.get('NBA_API_RETRIES', '3')),
+            cache=cache,
+        )
+
+    def _semaphore(self, name : str) -> threading.Semaphore:
+        with self._semaphores_lock:
+            if name not in self._semaphores:
+                limit = self.endpoint_limits.get(name, self.default_endpoint_limit)
+                self._semaphores[name] = threading.BoundedSemaphore(limit)
+            return self._semaphores[name]
+
+    def _backoff(self, attempt : int, error : Exception) -> float:
+        requested = retry_after(error)
+        if requested is not None:
+            return min(self.max_wait, requested)
+        # Full jitter keeps retrying workers from hitting upstream in lockstep
+        return random.uniform(0, min(self.max_wait, self.base_wait * 2 ** attempt))
+
+    def fetch(self, endpoint, **params) -> dict:
+        """
+        Calls an endpoint within the rate budget and returns its get_dict() payload.
+
+        Parameters:
+            endpoint: nba_api endpoint class (or fake with the same interface)
+            **params: keyword arguments for the endpoint
+
+        Returns:
+            dict: raw endpoint response containing resultSets
+        """
+        name = endpoint.__name__
+        if self.cache is not None:
+            data = self.cache.get(name, params)
+            if data is not None:
+                return data
+        for attempt in range(self.max_retries):
+            with self._semaphore(name):
+                self.limiter.acquire()
+                try:
+                    data = call_endpoint(endpoint, params)
+                except Exception as e:
+                    error = e
+                else:
+                    if self.cache is not None:
+                        self.cache.put(name, params, data)
+                    return data
+            if attempt == self.max_retries - 1 or not is_retryable(error):
+                raise error
+            wait_time = self._backoff(attempt, error)
+            logging.warning(f"Attempt {attempt + 1} failed for {name}. Retrying in {wait_time:.1f} seconds... Error: {error}")
+            time.sleep(wait_time)
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='nba-fetch')
+            return self._executor
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Runs fn on the worker pool and returns its Future.
+        """
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def map(self, fn, items) -> list[tuple]:
+        """
+        Runs fn over items on the worker pool.
+
+        Returns:
+            list[tuple]: (item, result, error) per item in input order; error is None on success
+        """
+        futures = [(item, self.submit(fn, item)) for item in items]
+        results = []
+        for item, future in futures:
+            try:
+                results.append((item, future.result(), None))
+            except Exception as e:
+                results.append((item, None, e))
+        return results
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+scheduler = FetchScheduler.from_env()
+
+
+def fetch(endpoint, **params) -> dict:
+    """
+    Fetches an endpoint through the shared scheduler.
+    """
+    return scheduler.fetch(endpoint, **params)
+
+
+def result_set(data : dict, index : int = 0) -> pl.DataFrame:
+    """
+    Converts one resultSet of an endpoint payload into a polars DataFrame.
+    """
+    return pl.DataFrame(data['resultSets'][index]['rowSet'], schema=data['resultSets'][index]['headers'], orient='row')
+
+
+def result_set_pandas(data : dict, index : int = 0) -> pd.DataFrame:
+    """
+    Converts one resultSet of an endpoint payload into a pandas DataFrame, like get_data_frames().
+    """
+    return pd.DataFrame(data['resultSets'][index]['rowSet'], columns=data['resultSets'][index]['headers'])
@@ -0,0 +1,216 @@
+import difflib
+import re
+import time
+import unicodedata
+from nba_api.stats.static import players, teams
+
+# Lowest difflib similarity ratio a misspelled or partial name is resolved at
+FUZZY_CUTOFF = 0.75
+# Lowest similarity of a misspelled name token, e.g. 'lebrn' -> 'lebron' but not 'lebron' -> 'leon'
+TOKEN_CUTOFF = 0.85
+NAME_SUFFIXES = {'jr', 'sr', 'ii', 'iii', 'iv'}
+
+
+def normalize(name : str) -> str:
+    """
+    Lowercases a name and strips accents, punctuation and extra whitespace,
+    e.g. 'Nikola Jokić' -> 'nikola jokic', "D'Angelo Russell" -> 'dangelo russell'.
+    """
+    name = unicodedata.normalize('NFKD', str(name))
+    name = ''.join(c for c in name if not unicodedata.combining(c))
+    name = re.sub(r"[.'’]", '', name.lower())
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', name).split())
+
+
+
+def covers_name(key : str, name : str) -> bool:
+    """
+    Whether every token of a normalized player name, generational suffixes aside, is matched
+    by a token of the normalized query: exactly, as a prefix ('steph' -> 'stephen') or as a
+    close misspelling ('lebrn' -> 'lebron').
+    """
+    tokens = key.split()
+    for name_token in name.split():
+        if name_token in NAME_SUFFIXES:
+            continue
+        if not any(token == name_token
+                   or (len(token) >= 3 and name_token.startswith(token))
+                   or difflib.SequenceMatcher(None, token, name_token).ratio() >= TOKEN_CUTOFF
+                   for token in tokens):
+            return False
+    return True
+
+
+class PlayerRecord:
+    __slots__ = ('id', 'full_name', 'first_name', 'last_name', 'is_active')
+
+    def __init__(self, id : int, full_name : str, first_name : str, last_name : str, is_active : bool) -> None:
+        self.id = id
+        self.full_name = full_name
+        self.first_name = first_name
+        self.last_name = last_name
+        self.is_active = is_active
+
+    def __repr__(self) -> str:
+        return f"PlayerRecord({self.id}, {self.full_name!r})"
+
+
+class TeamRecord:
+    __slots__ = ('id', 'full_name', 'abbreviation', 'nickname', 'city', 'state')
+
+    def __init__(self, id : int, full_name : str, abbreviation : str, nickname : str, city : str, state : str) -> None:
+        self.id = id
+        self.full_name = full_name
+        self.abbreviation = abbreviation
+        self.nickname = nickname
+        self.city = city
+        self.state = state
+
+    def __repr__(self) -> str:
+        return f"TeamRecord({self.id}, {self.full_name!r})"
+
+
+class IdentityIndex:
+    """
+    Precomputed player and team lookups over the nba_api static data.
+
+    Exact lookups by id, normalized (accent-stripped) name, team abbreviation, city, market
+    or nickname are single dict hits. Names that don't match exactly fall back to a fuzzy
+    match over the players sharing a name token, or over every name when no token is shared.
+    Both only accept a name at least FUZZY_CUTOFF similar, and a token candidate must also
+    match every part of its name, so an unknown name raises instead of resolving to another
+    player.
+
+    When several players share a name the active one wins, and ambiguous team keys
+    (e.g. the 'Los Angeles' city) keep the first team in the static data, like the
+    find_teams_by_city lookup they replace.
+
+    Example:
+        index = IdentityIndex.from_static()
+        index.find_player('nikola jokic').id
+        index.find_team('MIN').id
+    """
+    def __init__(self, player_rows : list[dict], team_rows : list[dict]) -> None:
+        self.players_by_id = {}
+        self.players_by_name = {}
+        self.players_by_token = {}
+        # Active players first so they win shared names and fuzzy ties
+        for row in sorted(player_rows, key=lambda row: not row['is_active']):
+            record = PlayerRecord(row['id'], row['full_name'], row['first_name'], row['last_name'], row['is_active'])
+            self.players_by_id[record.id] = record
+            key = normalize(record.full_name)
+            self.players_by_name.setdefault(key, record)
+            for token in key.split():
+                self.players_by_token.setdefault(token, []).append(key)
+        self.player_names = list(self.players_by_name)
+        self.player_rank = {name: rank for rank, name in enumerate(self.player_names)}
+
+        self.teams_by_id = {}
+        self.teams_by_key = {}
+        for row in team_rows:
+            record = TeamRecord(row['id'], row['full_name'], row['abbreviation'], row['nickname'], row['city'], row['state'])
+            self.teams_by_id[record.id] = record
+            # The market ('Golden State') isn't always the city ('San Francisco')
+            market = record.full_name.removesuffix(record.nickname)
+            for key in (record.full_name, record.abbreviation, record.city, market, record.nickname):
+                self.teams_by_key.setdefault(normalize(key), record)
+
+    @classmethod
+    def from_static(cls) -> "IdentityIndex":
+        return cls(players.get_players(), teams.get_teams())
+
+    def _fuzzy_player(self, key : str) -> PlayerRecord | None:
+        candidates = {name for token in key.split() for name in self.players_by_token.get(token, ())}
+        if candidates:
+            # Sharing a token isn't a match: 'Xyz Smith' or 'Lebron Smith' mustn't resolve to
+            # some other Smith, nor 'Edwards' to whichever Edwards is closest
+            candidates = [name for name in candidates if covers_name(key, name) and difflib.SequenceMatcher(None, key, name).ratio() >= FUZZY_CUTOFF]
+            if not candidates:
+                return None
+            # Highest similarity, active players (indexed first) winning ties
+            best = max(sorted(candidates, key=self.player_rank.get), key=lambda name: difflib.SequenceMatcher(None, key, name).ratio())
+            return self.players_by_name[best]
+        matches = difflib.get_close_matches(key, self.player_names, n=1, cutoff=FUZZY_CUTOFF)
+        return self.players_by_name[matches[0]] if matches else None
+
+    def find_player(self, name : str | int) -> PlayerRecord:
+        """
+        Returns the player matching an id or a (possibly accented, misspelled or partial) name.
+
+        Raises:
+            ValueError: If no player matches
+        """
+        if isinstance(name, int):
+            record = self.players_by_id.get(name)
+        else:
+            key = normalize(name)
+            record = self.players_by_name.get(key) or self._fuzzy_player(key)
+        if record is None:
+            raise ValueError(f"No player found for {name!r}")
+        return record
+
+    def find_team(self, name : str | int) -> TeamRecord:
+        """
+        Returns the team matching an id, full name, abbreviation, city, market or nickname.
+
+        Raises:
+            ValueError: If no team matches
+        """
+        if isinstance(name, int):
+            record = self.teams_by_id.get(name)
+        else:
+            key = normalize(name)
+            record = self.teams_by_key.get(key)
+            if record is None:
+                matches = difflib.get_close_matches(key, list(self.teams_by_key), n=1, cutoff=FUZZY_CUTOFF)
+                record = self.teams_by_key[matches[0]] if matches else None
+        if record is None:
+            raise ValueError(f"No team found for {name!r}")
+        return record
+
+
+index = IdentityIndex.from_static()
+
+
+def find_player(name : str | int) -> PlayerRecord:
+    return index.find_player(name)
+
+
+def find_team(name : str | int) -> TeamRecord:
+    return index.find_team(name)
+
+
+def benchmark(names : list[str], cities : list[str], repeat : int = 20) -> dict[str, float]:
+    """
+    Times the index against the nba_api regex lookups it replaces, in microseconds per lookup.
+    """
+    def timed(fn, items):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for item in items:
+                fn(item)
+        return (time.perf_counter() - start) / (repeat * len(items)) * 1e6
+
+    def static_team(city):
+        try:
+            return teams.find_teams_by_city(city)[0]
+        except IndexError:
+            return teams.find_teams_by_full_name(city)[0]
+
+    start = time.perf_counter()
+    IdentityIndex.from_static()
+    build_ms = (time.perf_counter() - start) * 1e3
+    return {
+        'build_ms': build_ms,
+        'static_player_us': timed(lambda name: players.find_players_by_full_name(name)[0], names),
+        'index_player_us': timed(find_player, names),
+        'static_team_us': timed(static_team, cities),
+        'index_team_us': timed(find_team, cities),
+    }
+
+
+if __name__ == "__main__":
+    from teams import ABRV_TEAM_DICT
+    sample_names = ['LeBron James', 'Anthony Edwards', 'Nikola Jokic', 'Luka Doncic', 'Stephen Curry', 'Jayson Tatum']
+    for measurement, value in benchmark(sample_names, list(ABRV_TEAM_DICT.values())).items():
+        print(f"{measurement}: {value:.2f}")
@@ -0,0 +1,129 @@
+import logging
+import os
+import time
+from datetime import date
+import polars as pl
+
+# Columns the lake adds to every row, dropped again when tables are rebuilt
+LAKE_COLUMNS = ['ingest_season', 'ingest_team', 'ingest_date', 'filename']
+
+
+class RawLake:
+    """
+    Landing layer of raw endpoint pulls, stored as zstd-compressed Parquet.
+
+    Every pull is written as its own file under
+    <root>/<endpoint>/ingest_season=<season>/ingest_team=<team>/ingest_date=<date>/part-<ns>.parquet
+    so warehouse tables can be rebuilt or backfilled from local disk with DuckDB
+    read_parquet scans instead of calling the API again.
+
+    Parameters:
+        root (str): directory of the lake
+    """
+    def __init__(self, root : str) -> None:
+        self.root = root
+
+    @classmethod
+    def from_env(cls) -> "RawLake":
+        """
+        Builds a lake rooted at NBA_LAKE_DIR (default 'lake').
+        """
+        return cls(os.environ.get('NBA_LAKE_DIR', 'lake'))
+
+    def write(self, endpoint : str, df : pl.DataFrame, season : str = None, team : int | str = None, ingest_date : date = None) -> str:
+        """
+        Writes one pull of an endpoint and returns the file path.
+        """
+        partition = os.path.join(
+            self.root,
+            endpoint,
+            f"ingest_season={season or 'all'}",
+            f"ingest_team={team or 'all'}",
+            f"ingest_date={(ingest_date or date.today()).isoformat()}",
+        )
+        os.makedirs(partition, exist_ok=True)
+        # The nanosecond stamp in the file name is the write time latest() orders pulls by
+        path = os.path.join(partition, f"part-{time.time_ns()}.parquet")
+        df.write_parquet(path, compression='zstd')
+        return path
+
+    def glob(self, endpoint : str) -> str:
+        return os.path.join(self.root, endpoint, '**', '*.parquet')
+
+    def scan(self, conn, endpoint : str, where : str = None) -> pl.DataFrame:
+        """
+        Reads every landed pull of an endpoint with a single DuckDB read_parquet scan.
+
+        Parameters:
+            conn: DuckDB connection object
+            endpoint (str): endpoint directory to read
+            where (str): optional SQL filter, e.g. on the ingest_* partition columns
+
+        Returns:
+            pl.DataFrame: landed rows plus the ingest_* partition columns and source filename
+        """
+        if not os.path.isdir(os.path.join(self.root, endpoint)):
+            return pl.DataFrame()
+        query = f"""
+            SELECT * FROM read_parquet('{self.glob(endpoint)}', hive_partitioning = true, union_by_name = true, filename = true)
+            {f'WHERE {where}' if where else ''}
+        """
+        return conn.execute(query).pl()
+
+
+def latest(df : pl.DataFrame, key : list[str]) -> pl.DataFrame:
+    """
+    Keeps the most recently landed row for each key and drops the lake columns.
+    """
+    if df.is_empty():
+        return df
+    # Order by the write-time stamp in the part-<ns> file name, not the full path, which would
+    # order same-day pulls from different endpoint/season/team directories alphabetically
+    written_at = pl.col('filename').str.extract(r'part-(\d+)\.parquet$').cast(pl.Int64)
+    return (df
+        .sort(written_at)
+        .unique(subset=key, keep='last', maintain_order=True)
+        .drop([column for column in LAKE_COLUMNS if column in df.columns])
+    )
+
+
+def replay(df : pl.DataFrame, transform) -> pl.DataFrame:
+    """
+    Applies an ingestion transform to landed rows, carrying the lake columns through so
+    latest() can still pick the newest pull per key afterwards.
+    """
+    if df.is_empty():
+        return df
+    lake_columns = [column for column in LAKE_COLUMNS if column in df.columns]
+    return transform(df.drop(lake_columns)).hstack(df.select(lake_columns))
+
+
+def rebuild_table(conn, table_name : str, df : pl.DataFrame) -> int:
+    """
+    Replaces a warehouse table with a frame rebuilt from the lake.
+    """
+    if df.is_empty():
+        logging.warning(f"Nothing landed for {table_name}, leaving table as is")
+        return 0
+    conn.register('rebuilt_df', df)
+    conn.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM rebuilt_df")
+    conn.unregister('rebuilt_df')
+    conn.commit()
+    logging.info(f"Rebuilt {table_name} with {df.height} rows from the lake")
+    return df.height
+
+
+lake = RawLake.from_env()
+
+
+def land(endpoint : str, df : pl.DataFrame, season : str = None, team : int | str = None):
+    """
+    Writes a pull to the shared lake unless NBA_LAKE=0. Landing errors are logged and never
+    fail the ingestion step that produced the data.
+    """
+    if os.environ.get('NBA_LAKE', '1') == '0' or df.is_empty():
+        return
+    try:
+        lake.write(endpoint, df, season=season, team=team)
+    except Exception as e:
+        logging.error(f"Error landing {endpoint} pull in the lake: {e}")
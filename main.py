@@ -1,16 +1,16 @@
 from players import Player
-from teams import Team, abrv_team_dict
+from teams import Team, read_opponent_features, team_season_features, league_team_season_features, OPPONENT_FEATURES
+from features import point_in_time_opponent_features
 from model import *
-from io import BytesIO
 
 import pandas as pd
 import time
-import joblib
-import boto3
 import numpy as np
 import polars as pl
 import logging
 from util import Database
+from fetch import scheduler
+from model_registry import model_registry
 import duckdb
 import json
 
@@ -24,15 +24,22 @@ logging.basicConfig(
 )
 
 
-def opp_data_polars(df : pl.DataFrame) -> pl.DataFrame:
+def opp_data_polars(df : pl.DataFrame, conn = None, source : str = 'auto') -> pl.DataFrame:
     """
     This function processes a Polars DataFrame containing game data and enriches it with opponent team statistics.
-    It handles API rate limiting and retries through a retry mechanism.
+
+    The two sources define the features differently: team_boxscores gives simple per-game
+    averages over the season, LeagueDashTeamStats possession-weighted season values. A call
+    never mixes them, every row of the result comes from the same source.
 
     Parameters:
         df (pl.DataFrame): Input DataFrame containing game data with columns:
             - OPPONENT: Team abbreviation (e.g. 'MIN', 'LAL')
             - SEASON_ID: Season identifier (e.g. '22023')
+        conn: Optional DuckDB connection object to read team_boxscores from
+        source (str): 'warehouse' (team_boxscores averages), 'api' (LeagueDashTeamStats), or
+            'auto' for the warehouse when it has every (OPPONENT, SEASON_ID) pair in df and
+            the API otherwise
 
     Returns:
         pl.DataFrame: Original DataFrame augmented with opponent team statistics:
@@ -42,78 +49,73 @@ def opp_data_polars(df : pl.DataFrame) -> pl.DataFrame:
             - PACE: Game pace
             - DEF_RATING: Defensive rating
 
+    Raises:
+        ValueError: If source is 'warehouse' and team_boxscores is missing some (OPPONENT, SEASON_ID) pairs
+
     The function:
     1. Filters data to seasons >= 2018-19
-    2. Creates a lookup dictionary of team stats to avoid redundant API calls
-    3. Implements retry logic for API requests with exponential backoff
-    4. Uses vectorized operations to efficiently add opponent stats columns
+    2. Builds a typed (OPPONENT, SEASON_ID) lookup frame of season averages from team_boxscores
+    3. Falls back to two league-wide calls per season, through the fetch scheduler, when that lookup doesn't cover every pair
+    4. Attaches all five columns with a single left join
     
     Example:
         df = pl.DataFrame({
             'OPPONENT': ['MIN', 'LAL'],
             'SEASON_ID': ['22023', '22023']
         })
-        enriched_df = opp_data_polars(df)
+        enriched_df = opp_data_polars(df, conn)
     """
-    team_dict = {}
+    if source not in ('auto', 'warehouse', 'api'):
+        raise ValueError(f"Unknown opponent feature source: {source}")
     df = df.filter(pl.col('SEASON_ID') >= '22018')
-    unique_combos = df.select(['OPPONENT', 'SEASON_ID']).unique()
-    logging.info(f"Creating team dictionary...")
-
-    def get_team_stats_with_retry(city, season_id, max_retries=3, wait_time=1):
-        for attempt in range(max_retries):
-            try:
-                team = Team(city)
-                team_df = team.get_team_opp_efga(season_id)  #TODO: This can come from the team_boxscores table
-                adv_stats_df = team.get_team_adv_stats(season_id) #TODO: This can come from the team_boxscores table
-                return {
-                    'OPP_EFG_PCT': team_df['OPP_EFG_PCT'][0],
-                    'OPP_FTA_RATE': team_df['OPP_FTA_RATE'][0],
-                    'OPP_OREB_PCT': team_df['OPP_OREB_PCT'][0],
-                    'PACE': adv_stats_df['PACE'][0],
-                    'DEF_RATING': adv_stats_df['DEF_RATING'][0]
-                }
-            except Exception as e:
-                logging.warning(f"Attempt {attempt + 1} failed for {city}: {str(e)}")
-                if attempt < max_retries - 1:
-                    logging.info(f"Waiting {wait_time} seconds before retry...")
-                    time.sleep(wait_time)
-                else:
-                    logging.error(f"All retries failed for {city}")
-                    raise
-
-    # Build the lookup dictionary with retry logic
-    team_dict = {}
-    for opp, season_id in unique_combos.iter_rows():
-        city = abrv_team_dict(opp)
-        logging.info(f"Processing {city} for season {season_id}")
-        team_dict[(opp, season_id)] = get_team_stats_with_retry(city, season_id)
-
-    logging.info(f"Team dictionary created...")
-
-    def lookup_stat(opp, season, stat):
-        return team_dict.get((opp, season), {})[stat]
-
-    # Add columns using vectorized operations
-    df = df.with_columns([
-        pl.struct(['OPPONENT', 'SEASON_ID']).map_elements(
-            lambda x: lookup_stat(x['OPPONENT'], x['SEASON_ID'], 'OPP_EFG_PCT')
-        ).alias('OPP_EFG_PCT'),
-        pl.struct(['OPPONENT', 'SEASON_ID']).map_elements(
-            lambda x: lookup_stat(x['OPPONENT'], x['SEASON_ID'], 'OPP_FTA_RATE')
-        ).alias('OPP_FTA_RATE'),
-        pl.struct(['OPPONENT', 'SEASON_ID']).map_elements(
-            lambda x: lookup_stat(x['OPPONENT'], x['SEASON_ID'], 'OPP_OREB_PCT')
-        ).alias('OPP_OREB_PCT'),
-        pl.struct(['OPPONENT', 'SEASON_ID']).map_elements(
-            lambda x: lookup_stat(x['OPPONENT'], x['SEASON_ID'], 'PACE')
-        ).alias('PACE'),
-        pl.struct(['OPPONENT', 'SEASON_ID']).map_elements(
-            lambda x: lookup_stat(x['OPPONENT'], x['SEASON_ID'], 'DEF_RATING')
-        ).alias('DEF_RATING')
-    ])
-
-    return df
+    season_ids = df['SEASON_ID'].unique().sort().to_list()
+    logging.info(f"Building opponent lookup for seasons {season_ids}...")
+
+    if source != 'api' and conn is not None:
+        lookup_df = team_season_features(conn, season_ids)
+        # Coverage is per opponent and season, a partially loaded season isn't covered
+        uncovered = df.select('OPPONENT', 'SEASON_ID').unique().join(lookup_df, on=['OPPONENT', 'SEASON_ID'], how='anti')
+        if uncovered.is_empty():
+            logging.info(f"Opponent lookup built from team_boxscores with {lookup_df.height} team seasons...")
+            return df.join(lookup_df, on=['OPPONENT', 'SEASON_ID'], how='left')
+        if source == 'warehouse':
+            raise ValueError(f"team_boxscores is missing {uncovered.height} opponent seasons, e.g. {uncovered.head(5).rows()}")
+        logging.info(f"team_boxscores is missing {uncovered.height} opponent seasons, using LeagueDashTeamStats for every season")
+    elif source == 'warehouse':
+        raise ValueError("source='warehouse' needs a connection")
+
+    frames = []
+    for season_id, season_df, error in scheduler.map(league_team_season_features, season_ids):
+        if error is not None:
+            logging.error(f"Failed to get team stats for season {season_id}: {error}")
+            raise error
+        frames.append(season_df)
+
+    lookup_df = pl.concat(frames) if frames else pl.DataFrame(schema={'OPPONENT': pl.String, 'SEASON_ID': pl.String})
+    logging.info(f"Opponent lookup built from LeagueDashTeamStats with {lookup_df.height} team seasons...")
+    return df.join(lookup_df, on=['OPPONENT', 'SEASON_ID'], how='left')
+
+def opp_data_point_in_time(df : pl.DataFrame, conn, window : str = 'L5') -> pl.DataFrame:
+    """
+    Leak-free alternative to opp_data_polars for training: every game gets its opponent's
+    features as of the day before the game, built from team_boxscores with one as-of join
+    (see features.point_in_time_opponent_features) instead of whole-season API stats.
+
+    Parameters:
+        df (pl.DataFrame): player games with OPPONENT, GAME_DATE and SEASON_ID columns
+        conn: DuckDB connection object to read team_boxscores from
+        window (str): 'L5', 'L10' or 'SEASON', matching the opponent_features window used at inference
+
+    Returns:
+        pl.DataFrame: df plus OPP_EFG_PCT, OPP_FTA_RATE, OPP_OREB_PCT, PACE and DEF_RATING
+    """
+    enriched_df = point_in_time_opponent_features(conn, df)
+    window_columns = {f"{feature}_{window}": feature for feature in OPPONENT_FEATURES}
+    form_columns = [f"{feature}_{suffix}" for feature in OPPONENT_FEATURES for suffix in ('L5', 'L10', 'SEASON')]
+    return (enriched_df
+        .drop([column for column in form_columns if column not in window_columns])
+        .rename(window_columns)
+    )
 
 def create_model(year: int, stats : pl.DataFrame, model_filename : str, stat : str, predictors: list):
     """
@@ -123,47 +125,58 @@ def create_model(year: int, stats : pl.DataFrame, model_filename : str, stat : s
     results.write_csv(f"{model_filename}.csv")
 
 
-def predict_result_polars(model_filename : str, city: str, minutes: float):
+def create_models(year : str, conn, predictors : list, stats : list[str], window : str = 'L5', workers : int = None) -> str:
+    """
+    Trains a model per player and stat for every player in player_boxscores in one parallel
+    run, with leak-free opponent features (see opp_data_point_in_time), and uploads them as
+    one bundle. The metrics table is written next to it as a CSV, like create_model's results.
+
+    Returns:
+        str: object key of the uploaded bundle
+    """
+    stats_df = opp_data_point_in_time(conn.execute("SELECT * FROM player_boxscores").pl(), conn, window)
+    bundle = train_models_parallel(stats_df, year, predictors, stats, workers=workers)
+    key = save_bundle_upload_s3(bundle)
+    bundle.metrics.write_csv(f"ridge_{bundle.version}_metrics.csv")
+    return key
+
+
+def predict_result_polars(model_filename : str, city: str, minutes: float, conn):
     """
     Get model prediction for a player's performance against a specific opponent.
 
     Parameters:
-        model_filename (str): Name of the saved model file in S3 bucket to use for prediction
+        model_filename (str): Name of the saved model file in the S3 bucket to use for prediction
         city (str): City name of the opponent team (e.g. 'Atlanta', 'Los Angeles Lakers')
         minutes (float): Projected minutes to be played by the player
+        conn: DuckDB connection object to read the opponent_features table from
 
     Returns:
         numpy.ndarray: Array containing the predicted stat value based on the model
 
     The function:
     1. Creates Team object for opponent team
-    2. Gets opponent's last 5 games stats (Four Factors and Advanced)
-    3. Combines stats into features DataFrame with projected minutes
-    4. Loads model from S3 bucket
+    2. Reads opponent's last 5 games features from the opponent_features table
+    3. Combines them into features DataFrame with projected minutes
+    4. Gets the model from the in-memory registry, which only downloads it on first use
     5. Makes prediction using loaded model and features
 
     Example:
-        >>> result = predict_result_polars('anthony_edwards_points_model.sav', 'Atlanta', 37.8)
+        >>> result = predict_result_polars('anthony_edwards_points_model.sav', 'Atlanta', 37.8, conn)
         >>> print(result)
         array([[24.5]])
     """
     opp_team = Team(city)
-    opp_df = opp_team.get_team_opp_efga('22024','5') #TODO: This can come from the team_boxscores table
-    adv_stats_df = opp_team.get_team_adv_stats('22024','5') #TODO: This can come from the team_boxscores table  
-    
+    opp_df = read_opponent_features(conn, 'L5', opp_team.id)
+    if opp_df.is_empty():
+        raise ValueError(f"No opponent features for {city}")
+
     opp_df = (opp_df
-        .with_columns([
-            pl.lit(adv_stats_df.select('PACE').row(0)[0]).alias('PACE'),
-            pl.lit(minutes).alias('MIN')
-        ])
+        .with_columns(pl.lit(minutes).alias('MIN'))
         .select(['OPP_EFG_PCT', 'OPP_FTA_RATE', 'OPP_OREB_PCT', 'PACE', 'MIN'])
     )
     
-    s3 = boto3.client("s3")
-    response = s3.get_object(Bucket='prasun-nba-model',Key=model_filename)
-    bytes_stream = BytesIO(response['Body'].read())
-    loaded_model = joblib.load(bytes_stream)
-    result = loaded_model.predict(opp_df)
+    result = model_registry.get(model_filename).predict(opp_df)
     return result
 
 
@@ -174,7 +187,7 @@ if __name__ == "__main__":
     # conn = duckdb.connect("player_boxscores.db")
     # pts_df = conn.sql(query).pl()
     # create_model(year='22022', stats=pts_df, predictors=predictors,stat='PTS',model_filename="anthony_edwards_points_model.sav")
-    # results = predict_result_polars('anthony_edwards_points_model.sav','Atlanta',37.8)
+    # results = predict_result_polars('anthony_edwards_points_model.sav','Atlanta',37.8, conn)
     # print(results)
 
 
@@ -6,9 +6,17 @@ from scipy.stats import poisson
 import pandas as pd
 import matplotlib.pyplot as plt
 import joblib
-import boto3
 import polars as pl
+import numpy as np
 import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from model_registry import model_registry
+from probabilities import poisson_engine
+
+# Object key prefix of the bundles written by train_models_parallel
+BUNDLE_PREFIX = 'bundles/'
 
 
 def RunLinearModel(trainx,trainy,testx,testy):
@@ -103,19 +111,17 @@ def build_TrainTest(df : pl.DataFrame, column : str):
     x_train,x_test,y_train,y_test = train_test_split(X,Y, test_size =.25, random_state =1)
     return x_train,x_test,y_train,y_test
 
-def poisson_dist(test_value : float, average : int):
+def poisson_dist(test_value : float, average : float):
     """
     Gives a probiliity for the oddsmaker line against the predicted value
     Parameters:
         test_value (float): oddsmaker line
-        average (int): predicted value
+        average (float): predicted value, used as the Poisson mean as is
+    Returns:
+        tuple: probabilities of finishing under and over the line, a push on a whole line counts as neither
     """
-    print(f"probability of {test_value} point", poisson.pmf(k=test_value,mu=average))
-    print(f"probability of less than {test_value} point", poisson.cdf(k=test_value,mu=average))
-    print(f"probability of greater than {test_value} point", 1-poisson.cdf(k=test_value,mu=average))
-    less_than = poisson.cdf(k=test_value,mu=average)
-    greater_than = 1-less_than
-    return less_than, greater_than
+    under, _, over = poisson_engine.probabilities(average, test_value)
+    return float(under), float(over)
 
 def linear_regression(csv_name : str, stat : str):
     stats = pd.read_csv(csv_name)
@@ -131,7 +137,7 @@ def linear_regression(csv_name : str, stat : str):
 
 def save_model_upload_s3(model, model_filename: str):
     """
-    Uploads model to s3 bucket
+    Uploads model to the model registry's bucket (S3, or MODEL_STORE_DIR locally)
     Parameters:
         model: trained sklearn model
         model_filename (str): name for saving the model
@@ -139,7 +145,179 @@ def save_model_upload_s3(model, model_filename: str):
     logging.info(f"Saving model to {model_filename}")
     joblib.dump(model, model_filename)
     
-    logging.info(f"Uploading model to S3")
-    s3 = boto3.client("s3")
-    s3.upload_file(model_filename, 'prasun-nba-model', model_filename)
-    logging.info(f"Model upload complete")
\ No newline at end of file
+    logging.info(f"Uploading model to {model_registry.bucket}")
+    model_registry.upload(model_filename)
+    logging.info(f"Model upload complete")
+
+
+class ModelBundle:
+    """
+    Coefficients of many per-player Ridge models trained together, stored as one matrix so
+    the whole set is a single object in the bucket.
+
+    Parameters:
+        version (str): bundle version, also part of its object key
+        predictors (list[str]): feature columns, in coefficient order
+        keys (list[tuple[int, str]]): (Player_ID, stat) of each model, one per coefficient row
+        coef (np.ndarray): coefficients, shape (models, predictors)
+        intercept (np.ndarray): intercepts, shape (models,)
+        metrics (pl.DataFrame): Player_ID, STAT, TRAIN_ROWS, TEST_ROWS, RMSE and R2 per model
+
+    Example:
+        bundle = model_registry.get('bundles/ridge_1730419200000000000.joblib')
+        bundle.predict(1630162, 'PTS', features_df.select(bundle.predictors))
+    """
+    def __init__(self, version : str, predictors : list[str], keys : list[tuple[int, str]], coef : np.ndarray, intercept : np.ndarray, metrics : pl.DataFrame) -> None:
+        self.version = version
+        self.predictors = predictors
+        self.keys = keys
+        self.coef = coef
+        self.intercept = intercept
+        self.metrics = metrics
+        self.index = {key: row for row, key in enumerate(keys)}
+
+    @property
+    def key(self) -> str:
+        return f"{BUNDLE_PREFIX}ridge_{self.version}.joblib"
+
+    def predict(self, player_id : int, stat : str, X) -> np.ndarray:
+        """
+        Predicts a stat for a player from rows of the bundle's predictors.
+
+        Raises:
+            KeyError: If the bundle has no model for the player and stat
+        """
+        row = self.index[(player_id, stat)]
+        return np.asarray(X, dtype=np.float64) @ self.coef[row] + self.intercept[row]
+
+
+def fit_ridge_task(task : tuple) -> tuple:
+    """
+    Fits one Ridge model in a worker process, the same way run_ridge_model does.
+
+    Parameters:
+        task (tuple): (key, X_train, y_train, X_test, y_test, alpha)
+
+    Returns:
+        tuple: (key, coefficients, intercept, RMSE, R^2), RMSE and R^2 are None without test rows
+    """
+    key, X_train, y_train, X_test, y_test, alpha = task
+    reg = Ridge(alpha=alpha)
+    reg.fit(X_train, y_train)
+    rmse = r2 = None
+    if len(y_test) > 0:
+        predictions = reg.predict(X_test)
+        rmse = sqrt(mean_squared_error(y_test, predictions))
+        r2 = r2_score(y_test, predictions) if len(y_test) > 1 else None
+    return key, reg.coef_, reg.intercept_, rmse, r2
+
+
+def training_tasks(stats_df : pl.DataFrame, year : str, predictors : list, stat_columns : list[str], alpha : float = 0.1) -> list[tuple]:
+    """
+    Splits a combined feature frame into one fit_ridge_task input per player and stat, with
+    the same train (seasons < year) / test (seasons >= year) split as run_ridge_model.
+    Players with fewer than two training games are left out.
+    """
+    stats_df = stats_df.drop_nulls(predictors)
+    tasks = []
+    for (player_id,), player_df in stats_df.group_by('Player_ID', maintain_order=True):
+        train = player_df.filter(pl.col('SEASON_ID') < year)
+        test = player_df.filter(pl.col('SEASON_ID') >= year)
+        if train.height < 2:
+            continue
+        X_train = train.select(predictors).to_numpy().astype(np.float64)
+        X_test = test.select(predictors).to_numpy().astype(np.float64)
+        for stat in stat_columns:
+            tasks.append((
+                (player_id, stat),
+                X_train, train[stat].to_numpy().astype(np.float64),
+                X_test, test[stat].to_numpy().astype(np.float64),
+                alpha,
+            ))
+    return tasks
+
+
+def train_models_parallel(stats_df : pl.DataFrame, year : str, predictors : list, stat_columns : list[str], workers : int = None, alpha : float = 0.1) -> ModelBundle:
+    """
+    Trains a Ridge model per player and stat from one combined feature frame, across cores
+    with a process pool, and collects every model into a single ModelBundle.
+
+    Parameters:
+        stats_df (pl.DataFrame): games of many players with Player_ID, SEASON_ID, the predictors and the stat columns
+        year (str): Season ID threshold - models train on seasons before this year and are scored on the rest
+        predictors (list): feature column names
+        stat_columns (list[str]): target stats, one model per player and stat
+        workers (int): worker processes, os.cpu_count() by default
+        alpha (float): Ridge regularization strength
+
+    Returns:
+        ModelBundle: the coefficients and a metrics table of every model
+    """
+    start = time.perf_counter()
+    tasks = training_tasks(stats_df, year, predictors, stat_columns, alpha)
+    if not tasks:
+        raise ValueError("No player has enough training games")
+    workers = workers or os.cpu_count() or 1
+    # Ship tasks in a few chunks per worker, a model fit is too quick to be worth a round trip each
+    chunksize = max(1, len(tasks) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(fit_ridge_task, tasks, chunksize=chunksize))
+
+    keys = [key for key, *_ in results]
+    metrics = pl.DataFrame({
+        'Player_ID': [player_id for player_id, _ in keys],
+        'STAT': [stat for _, stat in keys],
+        'TRAIN_ROWS': [len(task[2]) for task in tasks],
+        'TEST_ROWS': [len(task[4]) for task in tasks],
+        'RMSE': [rmse for *_, rmse, _ in results],
+        'R2': [r2 for *_, r2 in results],
+    }, schema_overrides={'RMSE': pl.Float64, 'R2': pl.Float64})
+    bundle = ModelBundle(
+        version=str(time.time_ns()),
+        predictors=list(predictors),
+        keys=keys,
+        coef=np.vstack([coef for _, coef, *_ in results]),
+        intercept=np.array([intercept for _, _, intercept, *_ in results], dtype=np.float64),
+        metrics=metrics,
+    )
+    seconds = time.perf_counter() - start
+    logging.info(f"Trained {len(keys)} models with {workers} workers in {seconds:.2f}s ({len(keys) / seconds:.1f} models/s)")
+    return bundle
+
+
+def save_bundle_upload_s3(bundle : ModelBundle, filename : str = None) -> str:
+    """
+    Saves a ModelBundle and uploads it to the model registry's bucket in a single upload.
+    Returns the bundle's object key.
+    """
+    filename = filename or os.path.basename(bundle.key)
+    logging.info(f"Saving bundle {bundle.version} with {len(bundle.keys)} models to {filename}")
+    joblib.dump(bundle, filename)
+    model_registry.upload(filename, bundle.key)
+    logging.info(f"Uploaded bundle to {model_registry.bucket}/{bundle.key}")
+    return bundle.key
+
+
+def benchmark(players : int = 500, games : int = 160, workers : int = None) -> dict[str, float]:
+    """
+    Models per second trained by train_models_parallel on a synthetic league of players x games,
+    with PTS, AST and REB models per player.
+    """
+    rng = np.random.default_rng(0)
+    rows = players * games
+    predictors = ['OPP_EFG_PCT', 'OPP_FTA_RATE', 'OPP_OREB_PCT', 'PACE', 'MIN']
+    stats_df = pl.DataFrame({
+        'Player_ID': np.repeat(np.arange(players), games),
+        'SEASON_ID': np.where(np.tile(np.arange(games), players) < games * 3 // 4, '22023', '22024'),
+        **{column: rng.random(rows) for column in predictors},
+        **{stat: rng.integers(0, 40, rows) for stat in ['PTS', 'AST', 'REB']},
+    })
+    start = time.perf_counter()
+    bundle = train_models_parallel(stats_df, '22024', predictors, ['PTS', 'AST', 'REB'], workers=workers)
+    seconds = time.perf_counter() - start
+    return {'models': len(bundle.keys), 'workers': workers or os.cpu_count() or 1, 'seconds': seconds, 'models_per_second': len(bundle.keys) / seconds}
+
+
+if __name__ == "__main__":
+    for measurement, value in benchmark().items():
+        print(f"{measurement}: {value}")
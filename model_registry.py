@@ -0,0 +1,267 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from hashlib import md5
+from io import BytesIO
+import boto3
+import joblib
+from botocore.exceptions import ClientError
+
+MODEL_BUCKET = 'prasun-nba-model'
+
+
+class LocalObjectStore:
+    """
+    Directory-backed stand-in for the S3 calls the registry makes, for running and testing
+    without AWS. Objects live at <root>/<bucket>/<key> and their ETag is the MD5 of the
+    content, like S3's for single-part uploads.
+
+    Example:
+        store = LocalObjectStore('model_store')
+        store.upload_file('anthony_edwards_points_model.sav', 'prasun-nba-model', 'anthony_edwards_points_model.sav')
+    """
+    def __init__(self, root : str) -> None:
+        self.root = root
+
+    def _path(self, bucket : str, key : str) -> str:
+        return os.path.join(self.root, bucket, key)
+
+    def _missing(self, bucket : str, key : str, operation : str):
+        return ClientError({'Error': {'Code': '404', 'Message': f"{bucket}/{key} not found"}}, operation)
+
+    def _etag(self, path : str) -> str:
+        with open(path, 'rb') as f:
+            return f'"{md5(f.read()).hexdigest()}"'
+
+    def head_object(self, Bucket : str, Key : str) -> dict:
+        path = self._path(Bucket, Key)
+        if not os.path.exists(path):
+            raise self._missing(Bucket, Key, 'HeadObject')
+        return {'ETag': self._etag(path), 'ContentLength': os.path.getsize(path)}
+
+    def get_object(self, Bucket : str, Key : str) -> dict:
+        path = self._path(Bucket, Key)
+        if not os.path.exists(path):
+            raise self._missing(Bucket, Key, 'GetObject')
+        with open(path, 'rb') as f:
+            body = f.read()
+        return {'Body': BytesIO(body), 'ETag': f'"{md5(body).hexdigest()}"', 'ContentLength': len(body)}
+
+    def upload_file(self, Filename : str, Bucket : str, Key : str):
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Copy then rename so a concurrent get_object never reads a partial file
+        staging_path = f"{path}.{time.time_ns()}.tmp"
+        shutil.copyfile(Filename, staging_path)
+        os.replace(staging_path, path)
+
+
+class ModelEntry:
+    __slots__ = ('model', 'etag', 'loaded_at')
+
+    def __init__(self, model, etag : str, loaded_at : float) -> None:
+        self.model = model
+        self.etag = etag
+        self.loaded_at = loaded_at
+
+
+class ModelRegistry:
+    """
+    Keeps deserialized models in memory so predictions don't download and unpickle a .sav
+    from S3 on every request.
+
+    At most `capacity` models are held, the least recently used one is dropped first. A
+    background thread sends a HEAD request for every held model each `refresh_interval`
+    seconds and reloads the ones whose ETag changed, e.g. after retraining. Requests never
+    talk to S3 unless the model isn't loaded yet. If S3 is unreachable, the loaded models
+    keep being served.
+
+    Parameters:
+        client: S3 client, or a LocalObjectStore
+        bucket (str): bucket the models are uploaded to
+        capacity (int): models kept in memory
+        refresh_interval (float): seconds between ETag checks
+        preload (list[str]): model keys loaded by start()
+
+    Example:
+        registry = ModelRegistry(boto3.client('s3'), preload=['anthony_edwards_points_model.sav']).start()
+        registry.get('anthony_edwards_points_model.sav').predict(features_df)
+    """
+    def __init__(self, client, bucket : str = MODEL_BUCKET, capacity : int = 32, refresh_interval : float = 300.0, preload : list[str] = None) -> None:
+        self.client = client
+        self.bucket = bucket
+        self.capacity = capacity
+        self.refresh_interval = refresh_interval
+        self.preload = preload or []
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.missing = set()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.reloads = 0
+        self.evictions = 0
+        self.refresh_failures = 0
+
+    @classmethod
+    def from_env(cls) -> "ModelRegistry":
+        """
+        Builds a registry from the environment:
+            MODEL_STORE_DIR: serve models from a LocalObjectStore directory instead of S3
+            S3_ENDPOINT_URL: S3-compatible endpoint, e.g. a local MinIO
+            MODEL_BUCKET: bucket name (default 'prasun-nba-model')
+            MODEL_CACHE_SIZE: models kept in memory (default 32)
+            MODEL_REFRESH_SECONDS: seconds between ETag checks (default 300)
+            MODEL_PRELOAD: comma-separated model keys loaded at startup
+        """
+        if os.environ.get('MODEL_STORE_DIR'):
+            client = LocalObjectStore(os.environ['MODEL_STORE_DIR'])
+        else:
+            client = boto3.client('s3', endpoint_url=os.environ.get('S3_ENDPOINT_URL'))
+        return cls(
+            client,
+            bucket=os.environ.get('MODEL_BUCKET', MODEL_BUCKET),
+            capacity=int(os.environ.get('MODEL_CACHE_SIZE', '32')),
+            refresh_interval=float(os.environ.get('MODEL_REFRESH_SECONDS', '300')),
+            preload=[key.strip() for key in os.environ.get('MODEL_PRELOAD', '').split(',') if key.strip()],
+        )
+
+    def _key_lock(self, key : str) -> threading.Lock:
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def _download(self, key : str) -> ModelEntry:
+        start = time.perf_counter()
+        response = self.client.get_object(Bucket=self.bucket, Key=key)
+        model = joblib.load(BytesIO(response['Body'].read()))
+        logging.info(f"Loaded model {key} in {time.perf_counter() - start:.2f}s")
+        return ModelEntry(model, response.get('ETag'), time.time())
+
+    def _store(self, key : str, entry : ModelEntry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                evicted, _ = self.entries.popitem(last=False)
+                self.evictions += 1
+                logging.info(f"Evicted model {evicted} from the registry")
+
+    def get(self, key : str):
+        """
+        Returns the deserialized model for a key, downloading it only if it isn't held.
+        Concurrent requests for the same missing model share a single download.
+
+        Raises:
+            botocore.exceptions.ClientError: If the model isn't in the bucket
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry.model
+            self.misses += 1
+        with self._key_lock(key):
+            with self.lock:
+                entry = self.entries.get(key)
+            if entry is None:
+                entry = self._download(key)
+                self._store(key, entry)
+                with self.lock:
+                    self.loads += 1
+            return entry.model
+
+    def get_if_exists(self, key : str):
+        """
+        Returns the model for a key, or None if the bucket doesn't have it. Missing keys are
+        remembered until the next refresh, so they don't cost a GET on every request.
+        """
+        with self.lock:
+            if key in self.missing:
+                return None
+        try:
+            return self.get(key)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+                raise
+            with self.lock:
+                self.missing.add(key)
+            return None
+
+    def refresh(self) -> int:
+        """
+        Sends a HEAD request per held model and reloads the ones whose ETag changed.
+        Returns the number of models reloaded.
+        """
+        with self.lock:
+            held = [(key, entry.etag) for key, entry in self.entries.items()]
+            self.missing.clear()
+        reloaded = 0
+        for key, etag in held:
+            try:
+                if self.client.head_object(Bucket=self.bucket, Key=key).get('ETag') == etag:
+                    continue
+                with self._key_lock(key):
+                    entry = self._download(key)
+                    with self.lock:
+                        # Dropped by the LRU in the meantime, let the next request load it
+                        if key not in self.entries:
+                            continue
+                        self.entries[key] = entry
+                        self.reloads += 1
+                reloaded += 1
+            except Exception as e:
+                with self.lock:
+                    self.refresh_failures += 1
+                logging.error(f"Error revalidating model {key}, keeping the loaded one: {e}")
+        return reloaded
+
+    def upload(self, filename : str, key : str = None):
+        """
+        Uploads a saved model and drops any loaded copy, so the next request loads the new one.
+        """
+        key = key or os.path.basename(filename)
+        self.client.upload_file(filename, self.bucket, key)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.missing.discard(key)
+
+    def _run(self):
+        while not self.stopped.wait(self.refresh_interval):
+            self.refresh()
+
+    def start(self) -> "ModelRegistry":
+        """
+        Loads the preload models and starts the background ETag checks.
+        """
+        if self.thread is None:
+            for key in self.preload:
+                try:
+                    self.get(key)
+                except Exception as e:
+                    logging.error(f"Error preloading model {key}: {e}")
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self._run, name='model-registry-refresher', daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'models': list(self.entries), 'capacity': self.capacity, 'hits': self.hits, 'misses': self.misses,
+                    'loads': self.loads, 'reloads': self.reloads, 'evictions': self.evictions,
+                    'refresh_failures': self.refresh_failures}
+
+
+model_registry = ModelRegistry.from_env()
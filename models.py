@@ -17,3 +17,18 @@ class LoginItem(BaseModel):
 class PoissonDist(BaseModel):
     predictedPoints: float
     bookLine: float
+
+class PoissonBatch(BaseModel):
+    means: list[float]
+    lines: list[float]
+    grid: bool = False
+    quantize: bool = False
+
+class PlayerGamesBatch(BaseModel):
+    players: list[str | int]
+    last_number_of_games: int = 10
+
+class SlateProjectionRequest(BaseModel):
+    game_date: str | None = None
+    lines: dict[str, float] = {}
+    last_number_of_games: int = 10
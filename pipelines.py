@@ -1,130 +1,271 @@
 from prefect import flow, task, get_run_logger
-import duckdb
-from teams import Team, ABRV_TEAM_DICT, team_stats
-from players import Player
-from time import sleep
+from prefect.task_runners import ThreadPoolTaskRunner
+from prefect.runtime import flow_run
+from teams import Team, ABRV_TEAM_DICT, league_roster, create_roster_snapshot_table, team_stats, create_team_defense_profile_table, team_stats_endpoint, team_game_log_endpoint, combine_team_game_logs, TEAM_GAME_LOG_MEASURES, create_league_team_boxscore_table, create_opponent_features_table
+from players import Player, create_league_boxscore_table, add_location_opponent, normalize_league_boxscores
+from nba_api.stats.library.parameters import Season
+from fetch import scheduler
+from warehouse import BulkUpserter, TABLE_KEYS, bump_data_version
+from watermarks import update_watermarks
+from lake import lake, latest, replay, rebuild_table
+import polars as pl
+from connections import flow_connection, task_cursor
+from replica import sync_replica
+from features import build_rolling_features
 import os
+import time
+from uuid import uuid4
 
-MOTHERDUCK_TOKEN = os.environ.get('motherduck_token')
+# Max tasks running at once, upstream request rate is still bounded by the fetch scheduler
+PIPELINE_CONCURRENCY = int(os.environ.get('PIPELINE_CONCURRENCY', '8'))
 
+# Warehouse tables refreshed by team_stats, by LeagueDashTeamStats measure type
+TEAM_STATS_TABLES = {
+    'Opponent': 'teams_opponent_stats',
+    'Defense': 'teams_defense_stats',
+    'Four Factors': 'teams_four_factors_stats',
+    'Advanced': 'teams_advanced_stats',
+}
 
 @task
-def populate_team_data(conn, team: Team, season : str):
-    team.create_team_table(conn, season=season)
+def populate_team_data(team: Team, season : str):
+    with task_cursor('populate_team_data') as conn:
+        team.create_team_table(conn, season=season)
 
 @task
-def populate_player_boxscores(team: Team):
+def populate_league_boxscores(season : str = Season.current_season, date_from : str = "", date_to : str = ""):
+    """
+    Loads every player's boxscores for the season (or date range) with league-wide calls
+    instead of one PlayerGameLog request per rostered player.
+    """
     logger = get_run_logger()
-    roster_df = team.get_team_roster()
-    roster= roster_df.select('PLAYER').to_series().to_list()
-    logger.info(f"Populating player data for {team.city}")
-    
-    with duckdb.connect(f"md:nba_data?motherduck_token={MOTHERDUCK_TOKEN}") as conn:
-        for name in roster:
-            try:
-                logger.info(f"Populating {name} data")
-                player = Player(name)
-                # Add exponential backoff retry logic
-                max_retries = 3
-                base_wait = 2  # Base wait time in seconds
-                
-                for attempt in range(max_retries):
-                    try:
-                        player.create_player_boxscore_table(conn)
-                        # If successful, wait standard rate limit time and break
-                        sleep(2)
-                        break
-                    except Exception as e:
-                        wait_time = base_wait ** (attempt + 1)  # Exponential backoff
-                        if attempt < max_retries - 1:
-                            logger.warning(f"Attempt {attempt + 1} failed for {name}. Retrying in {wait_time} seconds... Error: {e}")
-                            sleep(wait_time)
-                        else:
-                            raise Exception(f"All retries failed for {name}")
-                            
-            except Exception as e:
-                logger.error(f"Error creating player boxscore table for {name}: {e}")
-                continue 
+    start = time.perf_counter()
+    logger.info("Populating league player boxscores...")
+    with task_cursor('populate_league_boxscores') as conn:
+        create_league_boxscore_table(conn, season=season, date_from=date_from, date_to=date_to)
+    logger.info("Successfully populated league player boxscores...")
+    return time.perf_counter() - start
+
+@task
+def populate_team_boxscores(season : str = Season.current_season):
+    """
+    Loads every team's game logs for the season with league-wide calls, then rebuilds the
+    opponent_features table inference reads from.
+    """
+    logger = get_run_logger()
+    start = time.perf_counter()
+    logger.info("Populating league team boxscores...")
+    with task_cursor('populate_team_boxscores') as conn:
+        create_league_team_boxscore_table(conn, season=season)
+        create_opponent_features_table(conn)
+    logger.info("Successfully populated league team boxscores and opponent features...")
+    return time.perf_counter() - start
+
+@task
+def populate_rolling_features():
+    """
+    Appends rolling features for the games player_boxscores gained since the last run.
+    """
+    logger = get_run_logger()
+    start = time.perf_counter()
+    with task_cursor('populate_rolling_features') as conn:
+        rows = build_rolling_features(conn)
+    logger.info(f"Appended {rows} player rolling feature rows...")
+    return time.perf_counter() - start
 
 @task
 def populate_team_stats():
     logger = get_run_logger()
+    start = time.perf_counter()
     logger.info("Getting teams stats...")
-    with duckdb.connect(f"md:nba_data?motherduck_token={MOTHERDUCK_TOKEN}") as conn:
-        team_stats(conn, 'Opponent', 'teams_opponent_stats')
-        team_stats(conn, 'Defense', 'teams_defense_stats')
-        team_stats(conn, 'Four Factors', 'teams_four_factors_stats')
-        team_stats(conn, 'Advanced', 'teams_advanced_stats')
+    with task_cursor('populate_team_stats') as conn:
+        for stats_type, table_name in TEAM_STATS_TABLES.items():
+            team_stats(conn, stats_type, table_name)
+        create_team_defense_profile_table(conn)
     logger.info("Successfully populated teams stats...")
+    return time.perf_counter() - start
 
 @task
-def populate_player_shooting_splits(team : Team):
+def populate_player_shooting_splits(team : Team, roster_df : pl.DataFrame):
     logger = get_run_logger()
-    roster_df = team.get_team_roster()
-    roster= roster_df.select('PLAYER').to_series().to_list()
+    start = time.perf_counter()
     logger.info(f"Populating player data for {team.city}")
-    with duckdb.connect(f"md:nba_data?motherduck_token={MOTHERDUCK_TOKEN}") as conn:
-        for name in roster:
-            try:
-                logger.info(f"Populating {name} data")
-                player = Player(name)
-                max_retries = 3
-                base_wait = 2
-                for attempt in range(max_retries):
-                    try:
-                        player.create_player_shooting_splits_table(conn, team.id, "player_shooting_splits")
-                        sleep(2) 
-                        break
-                    except Exception as e:
-                        wait_time = base_wait ** (attempt + 1)  # Exponential backoff
-                        if attempt < max_retries - 1:
-                            logger.warning(f"Attempt {attempt + 1} failed for {name}. Retrying in {wait_time} seconds... Error: {e}")
-                            sleep(wait_time)
-                        else:
-                            raise Exception(f"All {max_retries} attempts failed for {name}. Error: {e}")
-            except Exception as e:
-                logger.error(f"Error creating player shooting splits table for {name}: {e}")
-                continue
+    upserter = BulkUpserter()
+    def load(row):
+        logger.info(f"Populating {row['PLAYER']} data")
+        upserter.stage('player_shooting_splits', Player(row['PLAYER'], row['PLAYER_ID']).shooting_splits(team.id))
+
+    for row, _, error in scheduler.map(load, roster_df.iter_rows(named=True)):
+        if error is not None:
+            logger.error(f"Error creating player shooting splits table for {row['PLAYER']}: {error}")
+    with task_cursor('populate_player_shooting_splits') as conn:
+        upserter.flush(conn)
+    return time.perf_counter() - start
 
 @task
-def populate_player_headline_stats(team : Team):
+def populate_player_headline_stats(team : Team, roster_df : pl.DataFrame):
     logger = get_run_logger()
-    roster_df = team.get_team_roster()
-    roster= roster_df.select('PLAYER').to_series().to_list()
+    start = time.perf_counter()
     logger.info(f"Populating player data for {team.city}")
-    with duckdb.connect(f"md:nba_data?motherduck_token={MOTHERDUCK_TOKEN}") as conn:
-        for name in roster:
-            try:
-                logger.info(f"Populating {name} data")
-                player = Player(name)
-                max_retries = 3
-                base_wait = 2
-                for attempt in range(max_retries):
-                    try:
-                        player.create_player_headline_stats_table(conn, "player_headline_stats")
-                        sleep(2)
-                        break
-                    except Exception as e:
-                        wait_time = base_wait ** (attempt + 1)  # Exponential backoff
-                        if attempt < max_retries - 1:
-                            logger.warning(f"Attempt {attempt + 1} failed for {name}. Retrying in {wait_time} seconds... Error: {e}")
-                            sleep(wait_time)
-                        else:
-                            raise Exception(f"All {max_retries} attempts failed for {name}. Error: {e}")
-            except Exception as e:
-                logger.error(f"Error creating player headline stats table for {name}: {e}")
-                continue
-
-@flow()
+    upserter = BulkUpserter()
+    def load(row):
+        logger.info(f"Populating {row['PLAYER']} data")
+        upserter.stage('player_headline_stats', Player(row['PLAYER'], row['PLAYER_ID']).headline_stats())
+
+    for row, _, error in scheduler.map(load, roster_df.iter_rows(named=True)):
+        if error is not None:
+            logger.error(f"Error creating player headline stats table for {row['PLAYER']}: {error}")
+    with task_cursor('populate_player_headline_stats') as conn:
+        upserter.flush(conn)
+    return time.perf_counter() - start
+
+@task
+def snapshot_rosters(season : str = Season.current_season) -> pl.DataFrame:
+    """
+    Fetches the league roster once for the run and stores it in roster_snapshots. Every
+    roster-driven task gets its team's slice, with PLAYER_IDs, from this snapshot.
+    """
+    run_id = str(flow_run.id or uuid4())
+    with task_cursor('snapshot_rosters') as conn:
+        roster_df = league_roster(season)
+        create_roster_snapshot_table(conn, roster_df, run_id)
+    return roster_df
+
+def timing_report(timings : list[dict], wall_time : float) -> pl.DataFrame:
+    """
+    Summarizes task durations of a flow run: the slowest team on the critical path, and how much
+    of the serial task time the concurrent run saved.
+    """
+    report = pl.DataFrame(timings, schema={'team': pl.String, 'task': pl.String, 'seconds': pl.Float64, 'status': pl.String})
+    per_team = (report
+        .group_by('team')
+        .agg(pl.col('seconds').max().alias('critical_seconds'), pl.col('seconds').sum().alias('total_seconds'),
+             (pl.col('status') == 'failed').sum().alias('failed_tasks'))
+        .sort('critical_seconds', descending=True, nulls_last=True)
+    )
+    serial_time = report['seconds'].sum()
+    logger = get_run_logger()
+    logger.info(f"Flow wall time {wall_time:.1f}s, serial task time {serial_time:.1f}s, speedup {serial_time / max(wall_time, 1e-9):.1f}x")
+    logger.info(f"Critical path per team:\n{per_team.head(10)}")
+    return per_team
+
+@task
+def publish_replica():
+    """
+    Copies the serving tables to the local replica the API reads in API_SERVING_MODE=replica.
+    Skipped when REPLICA_SYNC=0.
+    """
+    if os.environ.get('REPLICA_SYNC', '1') == '0':
+        return {}
+    with task_cursor('publish_replica') as conn:
+        return sync_replica(conn)
+
+@flow(task_runner=ThreadPoolTaskRunner(max_workers=PIPELINE_CONCURRENCY))
 def populate_data():
-    populate_team_stats()
-    
-    cities = ABRV_TEAM_DICT.values()
-    for city in cities:
-        team = Team(city)
-        # populate_team_data(conn, team, season='2024-25')
-        populate_player_boxscores(team)
-        populate_player_shooting_splits(team)
-        populate_player_headline_stats(team)
+    """
+    Refreshes every warehouse table. League-wide tasks and each team's roster-driven tasks are
+    submitted concurrently (at most PIPELINE_CONCURRENCY running), and a failing task only fails
+    its own team.
+    """
+    logger = get_run_logger()
+    flow_start = time.perf_counter()
+    with flow_connection() as warehouse:
+        futures = {
+            ('league', 'populate_team_stats'): populate_team_stats.submit(),
+            ('league', 'populate_league_boxscores'): populate_league_boxscores.submit(),
+            ('league', 'populate_team_boxscores'): populate_team_boxscores.submit(),
+        }
+        futures[('league', 'populate_rolling_features')] = populate_rolling_features.submit(wait_for=[futures[('league', 'populate_league_boxscores')]])
+        
+        roster_df = snapshot_rosters()
+        cities = ABRV_TEAM_DICT.values()
+        for city in cities:
+            team = Team(city)
+            team_roster_df = roster_df.filter(pl.col('TEAM_ID') == team.id)
+            # futures[(city, 'populate_team_data')] = populate_team_data.submit(team, season='2024-25')
+            futures[(city, 'populate_player_shooting_splits')] = populate_player_shooting_splits.submit(team, team_roster_df)
+            futures[(city, 'populate_player_headline_stats')] = populate_player_headline_stats.submit(team, team_roster_df)
+
+        timings = []
+        for (team_name, task_name), future in futures.items():
+            result = future.result(raise_on_failure=False)
+            if isinstance(result, BaseException):
+                logger.error(f"{task_name} failed for {team_name}: {result}")
+                timings.append({'team': team_name, 'task': task_name, 'seconds': None, 'status': 'failed'})
+            else:
+                timings.append({'team': team_name, 'task': task_name, 'seconds': result, 'status': 'completed'})
+        with task_cursor('bump_data_version') as conn:
+            bump_data_version(conn)
+        publish_replica()
+        logger.info(f"Warehouse timings per task:\n{warehouse.report()}")
+    return timing_report(timings, time.perf_counter() - flow_start)
+
+@task
+def rebuild_player_boxscores():
+    """
+    Rebuilds player_boxscores (and its watermarks) from landed LeagueGameLog and PlayerGameLog pulls.
+    """
+    with task_cursor('rebuild_player_boxscores') as conn:
+        frames = [
+            replay(lake.scan(conn, 'LeagueGameLog'), normalize_league_boxscores),
+            replay(lake.scan(conn, 'PlayerGameLog'), add_location_opponent),
+        ]
+        frames = [df for df in frames if not df.is_empty()]
+        boxscores_df = latest(pl.concat(frames, how='diagonal_relaxed'), TABLE_KEYS['player_boxscores']) if frames else pl.DataFrame()
+        rows = rebuild_table(conn, 'player_boxscores', boxscores_df)
+        update_watermarks(conn, 'player_boxscores', boxscores_df, league=True)
+        conn.commit()
+    return rows
+
+@task
+def rebuild_rolling_features():
+    with task_cursor('rebuild_rolling_features') as conn:
+        return build_rolling_features(conn, full=True)
+
+@task
+def rebuild_team_boxscores():
+    with task_cursor('rebuild_team_boxscores') as conn:
+        frames = [latest(lake.scan(conn, team_game_log_endpoint(measure_type)), ['GAME_ID', 'TEAM_ID']) for measure_type in TEAM_GAME_LOG_MEASURES]
+        team_df = combine_team_game_logs(*frames) if all(not df.is_empty() for df in frames) else pl.DataFrame()
+        rows = rebuild_table(conn, 'team_boxscores', team_df)
+        if rows:
+            create_opponent_features_table(conn)
+        return rows
+
+@task
+def rebuild_player_stats():
+    with task_cursor('rebuild_player_stats') as conn:
+        return {
+            'player_headline_stats': rebuild_table(conn, 'player_headline_stats', latest(lake.scan(conn, 'CommonPlayerInfo'), TABLE_KEYS['player_headline_stats'])),
+            'player_shooting_splits': rebuild_table(conn, 'player_shooting_splits', latest(lake.scan(conn, 'PlayerDashPtShots'), TABLE_KEYS['player_shooting_splits'])),
+        }
+
+@task
+def rebuild_team_stats():
+    with task_cursor('rebuild_team_stats') as conn:
+        rows = {table_name: rebuild_table(conn, table_name, latest(lake.scan(conn, team_stats_endpoint(stats_type)), ['TEAM_ID']))
+                for stats_type, table_name in TEAM_STATS_TABLES.items()}
+        if all(rows.values()):
+            create_team_defense_profile_table(conn)
+        return rows
+
+@flow(task_runner=ThreadPoolTaskRunner(max_workers=PIPELINE_CONCURRENCY))
+def rebuild_from_lake():
+    """
+    Rebuilds the warehouse tables from the raw Parquet lake without calling the API, e.g. after
+    a schema change or to backfill a fresh warehouse. Each table keeps the newest landed pull
+    per key, run through the same transforms as the live ingestion.
+    """
+    logger = get_run_logger()
+    with flow_connection():
+        player_boxscores = rebuild_player_boxscores.submit()
+        futures = [player_boxscores, rebuild_rolling_features.submit(wait_for=[player_boxscores]), rebuild_team_boxscores.submit(), rebuild_player_stats.submit(), rebuild_team_stats.submit()]
+        results = [future.result() for future in futures]
+        with task_cursor('bump_data_version') as conn:
+            bump_data_version(conn)
+        publish_replica()
+    logger.info(f"Rebuilt tables from the lake: {results}")
+    return results
+
 if __name__ == "__main__":
     populate_data.serve(name='player_boxscores', cron='0 8 * * *')
\ No newline at end of file
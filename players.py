@@ -1,27 +1,36 @@
-from nba_api.stats.endpoints import playercareerstats, PlayerDashboardByGameSplits, CommonPlayerInfo, PlayerDashboardByYearOverYear, CumeStatsPlayerGames, WinProbabilityPBP, PlayerGameLogs, PlayerGameLog, PlayerDashPtShots
-from nba_api.stats.static import players
-from nba_api.stats.library.parameters import SeasonAll, SeasonNullable
+from nba_api.stats.endpoints import playercareerstats, PlayerDashboardByGameSplits, CommonPlayerInfo, PlayerDashboardByYearOverYear, CumeStatsPlayerGames, WinProbabilityPBP, PlayerGameLogs, PlayerGameLog, PlayerDashPtShots, LeagueGameLog
+from nba_api.stats.library.parameters import SeasonAll, SeasonNullable, Season
 import pandas as pd
 import polars as pl
 import logging
 from util import mergeTables
+from fetch import fetch, result_set_pandas
+from watermarks import get_watermark, api_date, filter_new_games, update_watermarks
+from warehouse import upsert
+from lake import land
+from identity import find_player
+
+# Columns returned by PlayerGameLog, which player_boxscores was originally created from
+PLAYER_GAME_LOG_COLUMNS = ['SEASON_ID', 'Player_ID', 'Game_ID', 'GAME_DATE', 'MATCHUP', 'WL', 'MIN', 'FGM', 'FGA', 'FG_PCT', 'FG3M', 'FG3A', 'FG3_PCT',
+                           'FTM', 'FTA', 'FT_PCT', 'OREB', 'DREB', 'REB', 'AST', 'STL', 'BLK', 'TOV', 'PF', 'PTS', 'PLUS_MINUS', 'VIDEO_AVAILABLE']
+
 class Player:
-    def __init__(self, name : str) -> None:
+    def __init__(self, name : str, player_id : int = None) -> None:
         self.name = name
-        self.id = self.get_player_id()
+        # Roster-driven callers already know the id, skip the name search for them
+        self.id = player_id if player_id is not None else self.get_player_id()
 
     def get_player_id(self) -> int:
-        player_id = (players.find_players_by_full_name(self.name)[0])['id']
-        return player_id
+        return find_player(self.name).id
     
     def get_career_stats(self, season : str = None) -> pd.DataFrame:
         """
         TODO: Might removed double check value of this function
         """
         if season == None:
-            stats = playercareerstats.PlayerCareerStats(player_id=self.id,per_mode36="PerGame").get_data_frames()[0]
+            stats = result_set_pandas(fetch(playercareerstats.PlayerCareerStats, player_id=self.id,per_mode36="PerGame"), 0)
         else:
-            full_stats = playercareerstats.PlayerCareerStats(player_id=self.id,per_mode36="PerGame").get_data_frames()[0]
+            full_stats = result_set_pandas(fetch(playercareerstats.PlayerCareerStats, player_id=self.id,per_mode36="PerGame"), 0)
             stats = full_stats.loc[full_stats['SEASON_ID']== season]
         return stats
     
@@ -37,10 +46,10 @@ class Player:
         """
         regular_stats_columns = ['NAME','GP','MIN','FGM','FGA','FG_PCT','FG3M', 'FG3A', 'FG3_PCT', 'FTM', 'FTA', 'FT_PCT', 'REB', 'AST', 'TOV', 'STL', 'BLK', 'PTS', 'PLUS_MINUS']
         adv_stats_columns = ['NAME','W_PCT','OFF_RATING','DEF_RATING', 'NET_RATING', 'AST_PCT', 'AST_RATIO', 'EFG_PCT', 'TS_PCT', 'USG_PCT', 'POSS', 'PIE', 'PACE']
-        adv_stats = PlayerDashboardByGameSplits(player_id=self.id,per_mode_detailed=per_mode,measure_type_detailed='Advanced').get_data_frames()[0]
+        adv_stats = result_set_pandas(fetch(PlayerDashboardByGameSplits, player_id=self.id,per_mode_detailed=per_mode,measure_type_detailed='Advanced'), 0)
         adv_stats['NAME'] = self.name
         adv_player_stats = adv_stats[adv_stats_columns]
-        stats = PlayerDashboardByGameSplits(player_id=self.id,per_mode_detailed=per_mode).get_data_frames()[0]
+        stats = result_set_pandas(fetch(PlayerDashboardByGameSplits, player_id=self.id,per_mode_detailed=per_mode), 0)
         stats['NAME'] = self.name
         player_stats = stats[regular_stats_columns]
         final = mergeTables(player_stats, adv_player_stats)
@@ -61,10 +70,10 @@ class Player:
         """
         regular_stats_columns = ['GROUP_VALUE','NAME','GP','MIN','FGM','FGA','FG_PCT','FG3M', 'FG3A', 'FG3_PCT', 'FTM', 'FTA', 'FT_PCT', 'REB', 'AST', 'TOV', 'STL', 'BLK', 'PTS', 'PLUS_MINUS']
         adv_stats_columns = ['GROUP_VALUE','NAME','W_PCT','OFF_RATING','DEF_RATING', 'NET_RATING', 'AST_PCT', 'AST_RATIO', 'EFG_PCT', 'TS_PCT', 'USG_PCT', 'POSS', 'PIE', 'PACE']
-        stats = PlayerDashboardByYearOverYear(player_id=self.id,per_mode_detailed="PerGame", season=season, season_segment_nullable = season_segment, season_type_playoffs= season_type).get_data_frames()[1]
+        stats = result_set_pandas(fetch(PlayerDashboardByYearOverYear, player_id=self.id,per_mode_detailed="PerGame", season=season, season_segment_nullable = season_segment, season_type_playoffs= season_type), 1)
         stats['NAME'] = self.name
         player_career_stats = stats[regular_stats_columns]
-        adv_stats = PlayerDashboardByYearOverYear(player_id=self.id,per_mode_detailed="PerGame",measure_type_detailed="Advanced", season=season, season_segment_nullable = season_segment, season_type_playoffs= season_type).get_data_frames()[1]
+        adv_stats = result_set_pandas(fetch(PlayerDashboardByYearOverYear, player_id=self.id,per_mode_detailed="PerGame",measure_type_detailed="Advanced", season=season, season_segment_nullable = season_segment, season_type_playoffs= season_type), 1)
         adv_stats['NAME'] = self.name
         player_career_adv_stats = adv_stats[adv_stats_columns]
         final = mergeTables(player_career_stats,player_career_adv_stats)
@@ -74,7 +83,7 @@ class Player:
         '''
         Gives out game ids. Could use game ids in boxscore to create dataframe of box score for season
         '''
-        stats = CumeStatsPlayerGames(player_id=self.id,season_type_all_star='Regular Season').get_data_frames()[0]
+        stats = result_set_pandas(fetch(CumeStatsPlayerGames, player_id=self.id,season_type_all_star='Regular Season'), 0)
         # stats['MATCHUP'] = [re.sub('Timberwolves', '', x) for x in stats['MATCHUP']]
         # stats['MATCHUP'] = [re.sub('at', '', x) for x in stats['MATCHUP']]
         # stats[['DATE', 'OPPONENT','OPPONENT SUFFIX']] = stats["MATCHUP"].apply(lambda x: pd.Series(str(x).split()))
@@ -87,7 +96,7 @@ class Player:
 
     def test_func(self):
         '''Play by play see what can be done with this, move to team.py'''
-        pbp = WinProbabilityPBP('0022201225').get_data_frames()[0]
+        pbp = result_set_pandas(fetch(WinProbabilityPBP, game_id='0022201225'), 0)
         print(pbp)
 
     def player_career_boxscore(self,measure_type='Base') -> pd.DataFrame:
@@ -95,38 +104,26 @@ class Player:
         Returns player boxscore per game for entire career
         """
         # gamelog_df = PlayerGameLog(player_id=self.id,season=SeasonAll.all,measure_type='Advanced').get_data_frames()[0]
-        gamelog_df = PlayerGameLogs(player_id_nullable=self.id,season_nullable=SeasonNullable.current_season,measure_type_player_game_logs_nullable='Advanced').get_data_frames()[0]
+        gamelog_df = result_set_pandas(fetch(PlayerGameLogs, player_id_nullable=self.id,season_nullable=SeasonNullable.current_season,measure_type_player_game_logs_nullable='Advanced'), 0)
         return gamelog_df
     
     def player_boxscores(self, season) -> pd.DataFrame:
-        adv_stats_df = PlayerGameLogs(player_id_nullable=self.id,measure_type_player_game_logs_nullable='Advanced', season_nullable=season).get_data_frames()[0]
+        adv_stats_df = result_set_pandas(fetch(PlayerGameLogs, player_id_nullable=self.id,measure_type_player_game_logs_nullable='Advanced', season_nullable=season), 0)
         adv_stats_df = adv_stats_df.drop(columns=['NICKNAME','TEAM_NAME','TEAM_ID','TEAM_ABBREVIATION','GAME_DATE','MATCHUP','WL','MIN','FGM','FGA','FG_PCT','AVAILABLE_FLAG'])
         adv_stats_df.drop(list(adv_stats_df.filter(regex='RANK')), axis=1, inplace=True)
-        stats_df = PlayerGameLogs(player_id_nullable=self.id,season_nullable=season).get_data_frames()[0]
+        stats_df = result_set_pandas(fetch(PlayerGameLogs, player_id_nullable=self.id,season_nullable=season), 0)
         stats_df.drop(list(stats_df.filter(regex='RANK')), axis=1, inplace=True)
         stats_df = stats_df.drop(columns=['NICKNAME','WL','AVAILABLE_FLAG','NBA_FANTASY_PTS','DD2','TD3','WNBA_FANTASY_PTS'])
         gamelog_df = stats_df.merge(adv_stats_df,on=['PLAYER_ID','SEASON_YEAR','PLAYER_NAME','GAME_ID'])
         return gamelog_df
     
     
-    def player_minutes_polars(self) -> pl.DataFrame:
-        boxscores = PlayerGameLog(player_id=self.id,season=SeasonAll.all).get_dict()
-        boxscores_df = pl.DataFrame(boxscores['resultSets'][0]['rowSet'], schema=boxscores['resultSets'][0]['headers'])
-        return (pl.DataFrame(boxscores_df)
-                .select(
-                    pl.col('MIN'),
-                    pl.col('MIN').rolling_mean(window_size=3).alias('prev_3_avg'),
-                    pl.col('MIN').rolling_median(window_size=3).alias('prev_3_median'),
-                    pl.col('MIN').rolling_std(window_size=3).alias('prev_3_std')
-                )
-        )
-
-    def player_stat(self) -> pl.DataFrame:
+    def player_stat(self, date_from : str = "") -> pl.DataFrame:
         """
         Creates a polars DataFrame for training purposes with game stats and location info.
         
         Parameters:
-            stat (str): The statistical column to extract (e.g. 'PTS', 'AST', 'REB')
+            date_from (str): Optional 'MM/DD/YYYY' date, only games from this date on are requested
             
         Returns:
             pl.DataFrame: DataFrame containing:
@@ -143,28 +140,34 @@ class Player:
         """
         logging.info(f"Getting boxscores for {self.name}...")
         try:
-            boxscores = PlayerGameLog(player_id=self.id, timeout=10).get_dict()
+            boxscores = fetch(PlayerGameLog, player_id=self.id, date_from_nullable=date_from, timeout=10)
             boxscores_df = pl.DataFrame(boxscores['resultSets'][0]['rowSet'], schema=boxscores['resultSets'][0]['headers'], orient='row')
-            home_list = ["Away" if '@' in x else "Home" for x in boxscores_df['MATCHUP']]
-            opp_team = [x.split()[2] for x in boxscores_df['MATCHUP']]
-            boxscores_df = boxscores_df.with_columns([
-                pl.Series(name="LOCATION", values=home_list),
-                pl.Series(name="OPPONENT", values=opp_team)
-            ])
+            land('PlayerGameLog', boxscores_df)
+            boxscores_df = add_location_opponent(boxscores_df)
             logging.info(f"Returning boxscores for {self.name}...")
             return boxscores_df
         except Exception as e:
             logging.error(f"Error getting boxscores for {self.name}: {e}")
             raise
     
+    def headline_stats(self) -> pl.DataFrame:
+        """
+        Returns the player's headline stats (PTS/AST/REB/PIE) from the CommonPlayerInfo endpoint.
+        """
+        stats = fetch(CommonPlayerInfo, player_id=self.id)
+        stats_df = pl.DataFrame(stats['resultSets'][1]['rowSet'], schema=stats['resultSets'][1]['headers'], orient='row')
+        land('CommonPlayerInfo', stats_df)
+        return stats_df
+
     def create_player_headline_stats_table(self, conn , table_name : str):
         """
         WARNING: THIS MIGHT BE TEMPORARY. NOT SURE
 
         Creates a table in the database with player headline stats.
         
-        This function fetches common player info stats from the NBA API and either creates
-        a new table or updates an existing one in the provided database connection.
+        This function fetches common player info stats from the NBA API and upserts them
+        on PLAYER_ID in the provided database connection. To write many players at once,
+        stage headline_stats() frames in a warehouse.BulkUpserter instead.
         
         Args:
             conn: Database connection object
@@ -172,150 +175,129 @@ class Player:
             
         Raises:
             Exception: If there is an error fetching stats or updating the database
-            
-        The function will:
-        1. Fetch player headline stats using CommonPlayerInfo endpoint
-        2. Check if table exists in database
-        3. If table doesn't exist, create new table with stats
-        4. If table exists, update existing player's stats
-        5. Commit changes to database
-
-        
         """
         try:
-            stats = CommonPlayerInfo(player_id=self.id).get_dict()
-            stats_df = pl.DataFrame(stats['resultSets'][1]['rowSet'], schema=stats['resultSets'][1]['headers'], orient='row')
-            # Check if table exists
-            table_exists = conn.execute(f"""
-                SELECT EXISTS (
-                    SELECT 1 
-                    FROM information_schema.tables 
-                    WHERE table_name = '{table_name.lower()}'
-                )
-            """).fetchone()[0]
-
-            if not table_exists:
-                logging.info(f"Creating {table_name}...")
-                conn.execute(f"""
-                    CREATE TABLE {table_name} AS 
-                    SELECT * FROM stats_df
-                """)
-            else:
-                logging.info(f"Updating {table_name}...")
-                conn.register('new_stats', stats_df)
-                conn.execute(f"""
-                    DELETE FROM {table_name}
-                    WHERE PLAYER_ID = '{self.id}';
-                    
-                    INSERT INTO {table_name}
-                    SELECT * FROM new_stats;
-                """)
-            conn.commit()
+            upsert(conn, table_name, self.headline_stats(), key=['PLAYER_ID'])
             logging.info(f"Successfully populated {self.name} headline stats...")
         except Exception as e:
             logging.error(f"Error getting headline stats for {self.name}: {e}")
             raise
 
-    def player_minutes_polars(self) -> pl.DataFrame:
-        '''
-        Returns df for minutes projection. Not sure if needed. Could be useful for injuries.
-        '''
-        boxscores = PlayerGameLog(player_id=self.id,season=SeasonAll.all).get_dict()
-        boxscores_df = pl.DataFrame(boxscores['resultSets'][0]['rowSet'], schema=boxscores['resultSets'][0]['headers'])
-        return (pl.DataFrame(boxscores_df)
-                .select(
-                    pl.col('MIN'),
-                    pl.col('MIN').rolling_mean(window_size=3).alias('prev_3_avg'),
-                    pl.col('MIN').rolling_median(window_size=3).alias('prev_3_median'),
-                    pl.col('MIN').rolling_std(window_size=3).alias('prev_3_std')
-                )
-                .drop_nulls()
-        )
-    
     def create_player_boxscore_table(self, conn):
         """
         Creates/updates a DuckDB table with player boxscore data.
-        """
 
-        boxscores_df = self.player_stat()
-
-
-        # Check if table exists
-        table_exists = conn.execute("""
-            SELECT EXISTS (
-                SELECT 1 
-                FROM information_schema.tables 
-                WHERE table_name = 'player_boxscores'
-            )
-        """).fetchone()[0]
-
-        if not table_exists:
-            logging.info("Creating new player_boxscores table...")
-            conn.execute("""
-                CREATE TABLE player_boxscores AS 
-                SELECT * FROM boxscores_df
-            """)
-        else:
-            logging.info("Updating existing player_boxscores table...")
-            # Register the new data as a view
-            conn.register('new_boxscores', boxscores_df)
-            
-            # Insert only new records
-            conn.execute("""
-                INSERT INTO player_boxscores
-                SELECT n.* 
-                FROM new_boxscores n
-                WHERE NOT EXISTS (
-                    SELECT 1 
-                    FROM player_boxscores p
-                    WHERE p.GAME_ID = n.GAME_ID 
-                    AND p.Player_ID = n.Player_ID
-                )
-            """)
+        Only games after the player's watermark in ingest_watermarks are requested and upserted
+        on (GAME_ID, Player_ID), so the upstream payload and the write grow with new games
+        instead of career length.
+        """
+        watermark = get_watermark(conn, 'player_boxscores', self.id)
+        boxscores_df = self.player_stat(date_from=api_date(watermark))
+        if watermark is not None:
+            boxscores_df = filter_new_games(conn, 'player_boxscores', boxscores_df)
 
+        upsert(conn, 'player_boxscores', boxscores_df)
+        update_watermarks(conn, 'player_boxscores', boxscores_df)
         conn.commit()
 
         logging.info(f"Successfully updated boxscores for {self.name} in player_boxscores table")
 
 
+    def shooting_splits(self, team_id : str) -> pl.DataFrame:
+        """
+        Returns the player's overall per game shooting splits from the PlayerDashPtShots endpoint.
+        """
+        shots = fetch(PlayerDashPtShots, player_id=self.id, team_id=team_id, per_mode_simple="PerGame", timeout=10)
+        shots_df = pl.DataFrame(shots['resultSets'][0]['rowSet'], schema=shots['resultSets'][0]['headers'], orient='row')
+        land('PlayerDashPtShots', shots_df, team=team_id)
+        return shots_df
+
     def create_player_shooting_splits_table(self, conn, team_id : str, table_name : str):
         """
-        Creates/updates a DuckDB table with player shooting splits data.
-        try:
+        Creates/updates a DuckDB table with player shooting splits data, upserted on PLAYER_ID.
         """ 
         try:
-            shots = PlayerDashPtShots(player_id=self.id, team_id=team_id, per_mode_simple="PerGame", timeout=10).get_dict()
-            shots_df = pl.DataFrame(shots['resultSets'][0]['rowSet'], schema=shots['resultSets'][0]['headers'], orient='row')
-            # Check if table exists
-            table_exists = conn.execute(f"""
-                SELECT EXISTS (
-                    SELECT 1 
-                    FROM information_schema.tables 
-                    WHERE table_name = '{table_name.lower()}'
-                )
-            """).fetchone()[0]
-
-            if not table_exists:
-                logging.info(f"Creating {table_name}...")
-                conn.execute(f"""
-                    CREATE TABLE {table_name} AS 
-                    SELECT * FROM shots_df
-                """)
-            else:
-                logging.info(f"Updating {table_name}...")
-                conn.register('new_shots', shots_df)
-                conn.execute(f"""
-                    DELETE FROM {table_name}
-                    WHERE PLAYER_ID = '{self.id}';
-                    
-                    INSERT INTO {table_name}
-                    SELECT * FROM new_shots;
-                """)
-            conn.commit()
+            upsert(conn, table_name, self.shooting_splits(team_id), key=['PLAYER_ID'])
             logging.info(f"Successfully populated {self.name} shooting splits...")
         except Exception as e:
             logging.error(f"Error getting shooting splits for {self.name}: {e}")
             raise
 
 
+def add_location_opponent(df : pl.DataFrame) -> pl.DataFrame:
+    """
+    Adds LOCATION ('Home'/'Away') and OPPONENT (team abbreviation) columns derived from MATCHUP.
+
+    MATCHUP looks like 'MIN @ ATL' for away games and 'MIN vs. ATL' for home games,
+    so both columns are computed with column expressions instead of per-row Python.
+    """
+    return df.with_columns([
+        pl.when(pl.col('MATCHUP').str.contains('@', literal=True))
+            .then(pl.lit('Away'))
+            .otherwise(pl.lit('Home'))
+            .alias('LOCATION'),
+        pl.col('MATCHUP').str.split(' ').list.get(2).alias('OPPONENT')
+    ])
+
+
+def league_player_boxscores(season : str = Season.current_season, date_from : str = "", date_to : str = "") -> pl.DataFrame:
+    """
+    Gets every player's boxscores for a season (or date range) with a single league-wide call.
+
+    Parameters:
+        season (str): NBA season in format '2024-25'. Defaults to current season.
+        date_from (str): Optional start date 'MM/DD/YYYY'
+        date_to (str): Optional end date 'MM/DD/YYYY'
+
+    Returns:
+        pl.DataFrame: Same columns as Player.player_stat so rows can be loaded into player_boxscores
+    """
+    logging.info(f"Getting league boxscores for {season} {date_from}-{date_to}...")
+    boxscores = fetch(LeagueGameLog, player_or_team_abbreviation='P', season=season, date_from_nullable=date_from, date_to_nullable=date_to, timeout=100)
+    boxscores_df = pl.DataFrame(boxscores['resultSets'][0]['rowSet'], schema=boxscores['resultSets'][0]['headers'], orient='row')
+    land('LeagueGameLog', boxscores_df, season=season)
+    boxscores_df = normalize_league_boxscores(boxscores_df)
+    logging.info(f"Returning {boxscores_df.height} league boxscores...")
+    return boxscores_df
+
+
+def normalize_league_boxscores(df : pl.DataFrame) -> pl.DataFrame:
+    """
+    Converts raw LeagueGameLog player rows to the player_boxscores layout of Player.player_stat.
+    """
+    return add_location_opponent(df
+        .rename({'PLAYER_ID': 'Player_ID', 'GAME_ID': 'Game_ID'})
+        # LeagueGameLog returns ISO dates, PlayerGameLog returns 'APR 14, 2024'
+        .with_columns(
+            pl.col('GAME_DATE').str.to_date('%Y-%m-%d').dt.strftime('%b %d, %Y').str.to_uppercase()
+        )
+        .select(PLAYER_GAME_LOG_COLUMNS)
+    )
+
+
+def create_league_boxscore_table(conn, season : str = Season.current_season, date_from : str = "", date_to : str = ""):
+    """
+    Creates/updates the player_boxscores table for the whole league in one bulk upsert.
+
+    Without an explicit date_from only games after the league watermark are requested, and
+    rows are kept only if they are newer than that player's watermark. An explicit date_from
+    (backfill) writes every returned game, replacing rows with the same (GAME_ID, Player_ID).
+
+    Parameters:
+        conn: DuckDB connection object
+        season (str): NBA season in format '2024-25'. Defaults to current season.
+        date_from (str): Optional start date 'MM/DD/YYYY'
+        date_to (str): Optional end date 'MM/DD/YYYY'
+    """
+    watermark = get_watermark(conn, 'player_boxscores')
+    incremental = watermark is not None and not date_from
+    if incremental:
+        date_from = api_date(watermark)
+    boxscores_df = league_player_boxscores(season, date_from, date_to)
+    if incremental:
+        boxscores_df = filter_new_games(conn, 'player_boxscores', boxscores_df)
 
+    upsert(conn, 'player_boxscores', boxscores_df)
+    update_watermarks(conn, 'player_boxscores', boxscores_df, league=True)
+    conn.commit()
+    logging.info(f"Successfully loaded {boxscores_df.height} league boxscores into player_boxscores table")
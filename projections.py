@@ -0,0 +1,150 @@
+import logging
+import numpy as np
+import polars as pl
+from nba_api.stats.endpoints import ScoreboardV2
+from botocore.exceptions import BotoCoreError, ClientError
+from fetch import fetch, result_set
+from identity import normalize
+from teams import read_opponent_features
+from probabilities import poisson_engine
+
+# Feature columns the per-player points models are trained on, in training order
+POINTS_MODEL_FEATURES = ['OPP_EFG_PCT', 'OPP_FTA_RATE', 'OPP_OREB_PCT', 'PACE', 'MIN']
+
+
+def slate_from_scoreboard(games : dict[str, dict]) -> pl.DataFrame:
+    """
+    Expands a scoreboard snapshot (see scoreboard_games) to one row per team playing:
+    GAME_ID, TEAM_ID and OPP_TEAM_ID.
+    """
+    rows = []
+    for game_id, game in games.items():
+        rows.append((game_id, game['home_team_id'], game['away_team_id']))
+        rows.append((game_id, game['away_team_id'], game['home_team_id']))
+    return pl.DataFrame(rows, schema={'GAME_ID': pl.String, 'TEAM_ID': pl.Int64, 'OPP_TEAM_ID': pl.Int64}, orient='row')
+
+
+def slate_for_date(game_date : str) -> pl.DataFrame:
+    """
+    Gets the games scheduled on a date (YYYY-MM-DD) from ScoreboardV2, one row per team playing.
+    """
+    header_df = result_set(fetch(ScoreboardV2, game_date=game_date, league_id='00', day_offset=0, timeout=30), 0)
+    games_df = header_df.select('GAME_ID', 'HOME_TEAM_ID', 'VISITOR_TEAM_ID').unique(subset='GAME_ID', maintain_order=True)
+    return pl.concat([
+        games_df.select('GAME_ID', pl.col('HOME_TEAM_ID').alias('TEAM_ID'), pl.col('VISITOR_TEAM_ID').alias('OPP_TEAM_ID')),
+        games_df.select('GAME_ID', pl.col('VISITOR_TEAM_ID').alias('TEAM_ID'), pl.col('HOME_TEAM_ID').alias('OPP_TEAM_ID')),
+    ]).cast({'GAME_ID': pl.String, 'TEAM_ID': pl.Int64, 'OPP_TEAM_ID': pl.Int64})
+
+
+def slate_players(conn, slate_df : pl.DataFrame, last_number_of_games : int = 10) -> pl.DataFrame:
+    """
+    Expands a slate to every player on both rosters, with their average minutes over their
+    last games as the projected minutes, in one warehouse query.
+
+    Rosters come from the newest roster_snapshots run. Players without any games in
+    player_boxscores are left out, there are no minutes to project for them.
+
+    Parameters:
+        conn: DuckDB connection object
+        slate_df (pl.DataFrame): GAME_ID, TEAM_ID and OPP_TEAM_ID per team playing
+        last_number_of_games (int): games the projected minutes are averaged over
+
+    Returns:
+        pl.DataFrame: GAME_ID, PLAYER_ID, PLAYER, TEAM_ID, OPP_TEAM_ID and MIN per player
+    """
+    conn.register('slate_df', slate_df)
+    players_df = conn.execute(f"""
+        WITH roster AS (
+            SELECT PLAYER_ID, PLAYER, TEAM_ID
+            FROM roster_snapshots
+            WHERE RUN_ID = (SELECT RUN_ID FROM roster_snapshots ORDER BY SNAPSHOT_AT DESC LIMIT 1)
+        ),
+        recent_minutes AS (
+            SELECT Player_ID, AVG(MIN) AS MIN
+            FROM (
+                SELECT Player_ID, MIN
+                FROM player_boxscores
+                WHERE Player_ID IN (SELECT PLAYER_ID FROM roster WHERE TEAM_ID IN (SELECT TEAM_ID FROM slate_df))
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY Player_ID ORDER BY Game_ID DESC) <= {int(last_number_of_games)}
+            )
+            GROUP BY Player_ID
+        )
+        SELECT s.GAME_ID, r.PLAYER_ID, r.PLAYER, s.TEAM_ID, s.OPP_TEAM_ID, CAST(m.MIN AS DOUBLE) AS MIN
+        FROM slate_df s
+        JOIN roster r ON r.TEAM_ID = s.TEAM_ID
+        JOIN recent_minutes m ON m.Player_ID = r.PLAYER_ID
+        ORDER BY s.GAME_ID, s.TEAM_ID, r.PLAYER_ID
+    """).pl()
+    conn.unregister('slate_df')
+    return players_df
+
+
+def opponent_features(conn, window : str = 'L5') -> pl.DataFrame:
+    """
+    Every team's opponent features from the opponent_features table, keyed by OPP_TEAM_ID
+    for joining onto slate players.
+    """
+    return (read_opponent_features(conn, window)
+        .drop('DEF_RATING')
+        .rename({'TEAM_ID': 'OPP_TEAM_ID'})
+        .cast({'OPP_TEAM_ID': pl.Int64})
+    )
+
+
+def project_slate(players_df : pl.DataFrame, features_df : pl.DataFrame, registry, lines : dict[str, float] = None) -> tuple[pl.DataFrame, list[str]]:
+    """
+    Projects points for every player of a slate with a model, plus over/under probabilities.
+
+    The slate's features are assembled into one matrix by joining the opponent features
+    onto the players. Each model then predicts all of its rows in a single predict call.
+
+    Parameters:
+        players_df (pl.DataFrame): output of slate_players
+        features_df (pl.DataFrame): output of opponent_features
+        registry: ModelRegistry the points models are read from
+        lines (dict[str, float]): book lines by player name. Players without a line get the
+            half point above their rounded-down projection
+
+    Returns:
+        tuple[pl.DataFrame, list[str]]: the projections, and the players skipped for lack of a model or features
+    """
+    features = (players_df
+        .join(features_df, on='OPP_TEAM_ID', how='left')
+        .with_columns(pl.col('PLAYER').map_elements(normalize, return_dtype=pl.String).alias('PLAYER_KEY'))
+        .with_columns((pl.col('PLAYER_KEY').str.replace_all(' ', '_') + '_points_model.sav').alias('MODEL_KEY'))
+    )
+
+    projected, missing = [], []
+    for (model_key,), group in features.group_by('MODEL_KEY', maintain_order=True):
+        players = group['PLAYER'].to_list()
+        if group.select(POINTS_MODEL_FEATURES).null_count().sum_horizontal().item() > 0:
+            logging.warning(f"Missing opponent features for {players}, skipping")
+            missing.extend(players)
+            continue
+        try:
+            model = registry.get_if_exists(model_key)
+            if model is None:
+                missing.extend(players)
+                continue
+            prediction = np.asarray(model.predict(group.select(POINTS_MODEL_FEATURES))).reshape(-1)
+        except (ValueError, ClientError, BotoCoreError) as e:
+            logging.error(f"Error predicting with {model_key}: {e}")
+            missing.extend(players)
+            continue
+        # A linear model can go below zero for low minutes, points can't
+        projected.append(group.with_columns(pl.Series('PROJECTED_POINTS', np.clip(prediction, 0, None), dtype=pl.Float64)))
+
+    if not projected:
+        return pl.DataFrame(), missing
+
+    lines = {normalize(name): line for name, line in (lines or {}).items()}
+    projections_df = (pl.concat(projected)
+        .with_columns(
+            pl.col('PLAYER_KEY').replace_strict(lines, default=None, return_dtype=pl.Float64)
+                .fill_null(pl.col('PROJECTED_POINTS').floor() + 0.5)
+                .alias('LINE')
+        )
+        .drop('PLAYER_KEY', 'MODEL_KEY')
+    )
+    under, push, over = poisson_engine.probabilities(projections_df['PROJECTED_POINTS'].to_numpy(), projections_df['LINE'].to_numpy())
+    return projections_df.with_columns(pl.Series('UNDER', under), pl.Series('PUSH', push), pl.Series('OVER', over)), missing
@@ -0,0 +1,81 @@
+import logging
+import os
+import time
+import duckdb
+
+# Tables the API serves, copied to the local replica after every pipeline run
+SERVING_TABLES = [
+    'player_boxscores',
+    'player_shooting_splits',
+    'player_headline_stats',
+    'teams_opponent_stats',
+    'teams_defense_stats',
+    'teams_four_factors_stats',
+    'teams_advanced_stats',
+    'team_defense_profile',
+    'opponent_features',
+    'data_version',
+    'roster_snapshots',
+]
+
+
+def replica_path() -> str:
+    """
+    Local DuckDB file the serving tables are synced to, REPLICA_PATH (default 'nba_replica.duckdb').
+    """
+    return os.environ.get('REPLICA_PATH', 'nba_replica.duckdb')
+
+
+def sync_replica(conn, path : str = None, tables : list[str] = SERVING_TABLES, keep : int = 2) -> dict[str, int]:
+    """
+    Copies the serving tables from the warehouse into a new local DuckDB snapshot and points
+    the replica path at it.
+
+    Each sync writes a fresh file under <path>.snapshots/ and then swaps the <path> symlink
+    onto it with os.replace, so readers see either the previous snapshot or the complete new
+    one and never a half-written file. Every snapshot has its own file name because DuckDB
+    keeps reusing an open database for a path it already has open. Tables missing from the
+    warehouse are skipped, and only the newest `keep` snapshots are kept on disk.
+
+    Parameters:
+        conn: DuckDB connection object to the warehouse
+        path (str): replica path, replica_path() by default
+        tables (list[str]): tables to copy
+        keep (int): snapshots to keep, so readers still on the previous one aren't cut off
+
+    Returns:
+        dict[str, int]: rows copied per table
+    """
+    path = os.path.abspath(path or replica_path())
+    snapshot_dir = f"{path}.snapshots"
+    os.makedirs(snapshot_dir, exist_ok=True)
+    version = time.time_ns()
+    snapshot_path = os.path.join(snapshot_dir, f"{version}.duckdb")
+    alias = f"replica_{version}"
+
+    start = time.perf_counter()
+    rows = {}
+    conn.execute(f"ATTACH '{snapshot_path}' AS {alias}")
+    try:
+        for table_name in tables:
+            try:
+                conn.execute(f"CREATE TABLE {alias}.{table_name} AS SELECT * FROM {table_name}")
+            except duckdb.CatalogException:
+                logging.warning(f"{table_name} not found in the warehouse, leaving it out of the replica")
+                continue
+            rows[table_name] = conn.execute(f"SELECT COUNT(*) FROM {alias}.{table_name}").fetchone()[0]
+        conn.execute(f"DETACH {alias}")
+    except Exception:
+        conn.execute(f"DETACH DATABASE IF EXISTS {alias}")
+        for leftover in (snapshot_path, f"{snapshot_path}.wal"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+
+    link_path = f"{path}.{version}.tmp"
+    os.symlink(snapshot_path, link_path)
+    os.replace(link_path, path)
+    for old_snapshot in sorted(os.listdir(snapshot_dir), key=lambda name: int(name.split('.')[0]))[:-keep]:
+        os.remove(os.path.join(snapshot_dir, old_snapshot))
+    logging.info(f"Synced {len(rows)} tables to replica {path} in {time.perf_counter() - start:.2f}s")
+    return rows
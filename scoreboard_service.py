@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from nba_api.live.nba.endpoints import scoreboard
+
+
+def scoreboard_games() -> dict[str, dict]:
+    """
+    Today's games from the live ScoreBoard endpoint, keyed by game id.
+    """
+    games = scoreboard.ScoreBoard().games.get_dict()
+    response = {}
+    for game in games:
+        response[game['gameId']] = {
+            'home_team': game['homeTeam']['teamCity'] + ' ' + game['homeTeam']['teamName'],
+            'away_team': game['awayTeam']['teamCity'] + ' ' + game['awayTeam']['teamName'],
+            'home_team_id': game['homeTeam']['teamId'],
+            'away_team_id': game['awayTeam']['teamId'],
+        }
+    return response
+
+
+class ScoreboardService:
+    """
+    Polls the live scoreboard on a background thread and serves every request from the last snapshot.
+
+    Upstream is called once per interval however many clients there are. When a refresh fails
+    the previous snapshot keeps being served; it is reported as stale once it is older than two
+    intervals or was fetched before the last midnight (a new game day).
+
+    Parameters:
+        interval (float): seconds between upstream polls
+        fetch_fn: returns the scoreboard payload, scoreboard_games by default
+
+    Example:
+        service = ScoreboardService(interval=60).start()
+        games, fetched_at, stale = service.snapshot()
+    """
+    def __init__(self, interval : float = 60.0, fetch_fn = scoreboard_games) -> None:
+        self.interval = interval
+        self.fetch_fn = fetch_fn
+        self.games = None
+        self.fetched_at = None
+        self.failures = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    @classmethod
+    def from_env(cls) -> "ScoreboardService":
+        """
+        Builds a service polling every SCOREBOARD_REFRESH_SECONDS (default 60).
+        """
+        return cls(interval=float(os.environ.get('SCOREBOARD_REFRESH_SECONDS', '60')))
+
+    def refresh(self) -> bool:
+        """
+        Fetches a new snapshot. Returns False and keeps the old one if upstream fails.
+        """
+        try:
+            games = self.fetch_fn()
+        except Exception as e:
+            with self.lock:
+                self.failures += 1
+            logging.error(f"Error refreshing scoreboard, serving snapshot from {self.fetched_at}: {e}")
+            return False
+        with self.lock:
+            self.games = games
+            self.fetched_at = datetime.now()
+        return True
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.refresh()
+
+    def start(self) -> "ScoreboardService":
+        if self.thread is None:
+            self.refresh()
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self._run, name='scoreboard-refresher', daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def snapshot(self) -> tuple[dict | None, datetime | None, bool]:
+        """
+        Returns (games, fetched_at, stale). Games is None only if no fetch has ever succeeded.
+        """
+        with self.lock:
+            games, fetched_at = self.games, self.fetched_at
+        if fetched_at is None:
+            return None, None, True
+        now = datetime.now()
+        midnight = datetime.combine(now.date(), datetime.min.time())
+        stale = fetched_at < midnight or now - fetched_at > timedelta(seconds=2 * self.interval)
+        return games, fetched_at, stale
@@ -1,11 +1,16 @@
-from nba_api.stats.static import teams
-from nba_api.stats.endpoints import TeamPlayerDashboard, PlayerDashboardByGameSplits, LeagueGameLog, LeagueDashTeamStats, LeagueDashPtTeamDefend, TeamGameLogs, CommonTeamRoster
+from nba_api.stats.endpoints import TeamPlayerDashboard, PlayerDashboardByGameSplits, LeagueGameLog, LeagueDashTeamStats, LeagueDashPtTeamDefend, TeamGameLogs, CommonTeamRoster, CommonAllPlayers
 from nba_api.stats.library.parameters import Season
 import polars as pl
 import pandas as pd
 from players import Player
+from fetch import fetch, result_set, result_set_pandas
+from warehouse import upsert
+from lake import land
+from identity import find_team, index as identity_index
 from functools import lru_cache
+from datetime import datetime
 import logging
+import duckdb
 ABRV_TEAM_DICT = {'ATL': "Atlanta", 'BKN': 'Brooklyn', 'BOS': 'Boston', 'CHA': 'Charlotte', 'CHI': 'Chicago', 'CLE': 'Cleveland', 'DAL': 'Dallas', 'DEN': 'Denver', 'DET': 'Detroit', 'GSW': 'Golden State',
                       'HOU': "Houston", 'IND': 'Indiana', 'MEM': 'Memphis', 'MIA': 'Miami', 'MIL': 'Milwaukee', 'MIN': 'Minnesota', 'NOP': 'New Orleans', 'NYK': 'New York', 'LAC': 'Los Angeles Clippers', 'LAL': 'Los Angeles Lakers', 
                       'OKC': 'Oklahoma City', 'ORL': 'Orlando', 'PHI': 'Philadelphia', 'PHX': 'Phoenix', 'POR': 'Portland', 'SAC': 'Sacramento', 'SAS': 'San Antonio', 'TOR': 'Toronto', 'UTA': 'Utah', 'WAS': 'Washington'}
@@ -27,17 +32,13 @@ class Team:
         self.id = self.get_team_id()
 
     def get_team_id(self) -> int:
-        try:
-            team_id = (teams.find_teams_by_city(self.city)[0])['id']
-        except:
-            team_id = (teams.find_teams_by_full_name(self.city)[0])['id']
-        return team_id
+        return find_team(self.city).id
     
     def get_team_stats(self) -> pd.DataFrame:
         """
         Not sure if keeping this function
         """
-        team_stats =TeamPlayerDashboard(team_id=self.id).get_data_frames()[0]
+        team_stats =result_set_pandas(fetch(TeamPlayerDashboard, team_id=self.id), 0)
         return team_stats
     
 
@@ -63,7 +64,7 @@ class Team:
         return pd.concat([player.get_current_season_stats() for player in lineup])
 
     def team_scores(self):
-        boxscore = LeagueGameLog().get_data_frames()[0]
+        boxscore = result_set_pandas(fetch(LeagueGameLog), 0)
         return boxscore
     
     # def team_rebounding_stats(self, season : str = None, season_type : str = "Regular Season", season_segment : str = None) -> pd.DataFrame:
@@ -80,9 +81,11 @@ class Team:
 
     @staticmethod
     def get_season(season_id : str) -> str:
-        year = season_id[-2:]
-        year_dict={'23':'2023-24','22':'2022-23','21':'2021-22','20':'2020-21','19':'2019-20','18':'2018-2019','17':'2017-2018'}
-        return year_dict.get(year)
+        """
+        Season of a SEASON_ID, e.g. '22023' -> '2023-24'.
+        """
+        start = int(season_id[-4:])
+        return f"{start}-{(start + 1) % 100:02d}"
 
     
     def get_team_opp_efga(self, season_id: str, last_number_games : str = "0") -> pl.DataFrame:
@@ -95,7 +98,7 @@ class Team:
         """
         logging.info(f"Getting team opp efga for {self.city}...")
         season_year = self.get_season(season_id)
-        stats = LeagueDashTeamStats(team_id_nullable=self.id,measure_type_detailed_defense='Four Factors',season=season_year, last_n_games=last_number_games, timeout=100).get_dict()
+        stats = fetch(LeagueDashTeamStats, team_id_nullable=self.id,measure_type_detailed_defense='Four Factors',season=season_year, last_n_games=last_number_games, timeout=100)
         stats_df = pl.DataFrame(stats['resultSets'][0]['rowSet'], schema=stats['resultSets'][0]['headers'])
         logging.info(f"Returning team opp efga for {self.city}...")
         return stats_df
@@ -110,13 +113,13 @@ class Team:
         """
         logging.info(f"Getting team adv stats for {self.city}...")
         season_year = self.get_season(season_id)
-        stats = LeagueDashTeamStats(team_id_nullable=self.id,measure_type_detailed_defense='Advanced',season=season_year, last_n_games=last_number_games,timeout=100).get_dict()
+        stats = fetch(LeagueDashTeamStats, team_id_nullable=self.id,measure_type_detailed_defense='Advanced',season=season_year, last_n_games=last_number_games,timeout=100)
         stats_df = pl.DataFrame(stats['resultSets'][0]['rowSet'], schema=stats['resultSets'][0]['headers'])
         logging.info(f"Returning team adv stats for {self.city}...")
         return stats_df
         
     def get_team_def(self):
-        df = LeagueDashPtTeamDefend(team_id_nullable=self.id).get_data_frames()[0]
+        df = result_set_pandas(fetch(LeagueDashPtTeamDefend, team_id_nullable=self.id), 0)
 
     def get_team_game_log(self, season=Season.current_season) -> pl.DataFrame:
         """
@@ -144,29 +147,13 @@ class Team:
             team = Team('Minnesota')
             df = team.get_team_game_log_polars('2023-24')
         """
-        # Four Factors - opponent data
-        ff_df = TeamGameLogs(team_id_nullable=self.id, measure_type_player_game_logs_nullable='Four Factors',season_nullable=season).get_dict()
-        ff_df = pl.DataFrame(ff_df['resultSets'][0]['rowSet'], schema=ff_df['resultSets'][0]['headers'])
-        ff_df = ff_df.drop(["AVAILABLE_FLAG","MIN","GP_RANK","W_RANK","L_RANK","W_PCT_RANK","MIN_RANK"])
-        # Advanced stats - team data
-        adv_stats = TeamGameLogs(team_id_nullable=self.id, measure_type_player_game_logs_nullable='Advanced',season_nullable=season).get_dict()
-        adv_df = pl.DataFrame(adv_stats['resultSets'][0]['rowSet'], schema=adv_stats['resultSets'][0]['headers'])
-        adv_df = adv_df.drop(["AVAILABLE_FLAG","MIN","GP_RANK","W_RANK","L_RANK","W_PCT_RANK","MIN_RANK","OREB_PCT","EFG_PCT","TM_TOV_PCT","OREB_PCT_RANK","TM_TOV_PCT_RANK","EFG_PCT_RANK"])
-
-        df =ff_df.join(adv_df,on=['GAME_ID','SEASON_YEAR','TEAM_ID','GAME_DATE','MATCHUP', 'TEAM_ABBREVIATION', 'WL','TEAM_NAME'],how="inner")
-
-        reg_stats = TeamGameLogs(team_id_nullable=self.id,season_nullable=season).get_dict()
-        reg_df = pl.DataFrame(reg_stats['resultSets'][0]['rowSet'], schema=reg_stats['resultSets'][0]['headers'])
-        reg_df = reg_df.drop(["AVAILABLE_FLAG","MIN","GP_RANK","W_RANK","L_RANK","W_PCT_RANK","MIN_RANK"])
-        home_list = ["Away" if '@' in x else "Home" for x in reg_df['MATCHUP']]
-        opp_team = [x.split()[2] for x in reg_df['MATCHUP']]
-        reg_df = reg_df.with_columns([
-            pl.Series(name="LOCATION", values=home_list),
-            pl.Series(name="OPPONENT", values=opp_team)
-        ])
-
-        team_df = df.join(reg_df,on=['GAME_ID','SEASON_YEAR','TEAM_ID','GAME_DATE','MATCHUP', 'TEAM_ABBREVIATION', 'WL','TEAM_NAME'],how="inner")
-        return team_df
+        frames = {}
+        for measure_type in TEAM_GAME_LOG_MEASURES:
+            # Four Factors - opponent data, Advanced - team data, Base - regular box score stats
+            stats = fetch(TeamGameLogs, team_id_nullable=self.id, measure_type_player_game_logs_nullable=measure_type, season_nullable=season)
+            frames[measure_type] = pl.DataFrame(stats['resultSets'][0]['rowSet'], schema=stats['resultSets'][0]['headers'])
+            land(team_game_log_endpoint(measure_type), frames[measure_type], season=season, team=self.id)
+        return combine_team_game_logs(frames['Four Factors'], frames['Advanced'], frames['Base'])
         
     
     def create_team_table(self, conn, season=Season.current_season):
@@ -182,36 +169,9 @@ class Team:
         # Get team data
         team_df = self.get_team_game_log(season)
         
-        # Check if table exists
-        table_exists = conn.execute("""
-            SELECT EXISTS (
-                SELECT 1 
-                FROM information_schema.tables 
-                WHERE table_name = 'team_boxscores'
-            )
-        """).fetchone()[0]
-        
-        if not table_exists:
-            logging.info("Creating team_boxscores table...")
-            # Create table with schema from team_df
-            conn.execute("CREATE TABLE team_boxscores AS SELECT * FROM team_df WHERE 1=0")
-            
-        # Register the polars dataframe as a view
-        conn.register('team_boxscores_view', team_df)
-        
-        # Insert new records that don't already exist
-        conn.execute("""
-            INSERT INTO team_boxscores 
-            SELECT * FROM team_boxscores_view 
-            WHERE NOT EXISTS (
-                SELECT 1 FROM team_boxscores t 
-                WHERE t.GAME_ID = team_boxscores_view.GAME_ID
-                AND t.TEAM_ID = team_boxscores_view.TEAM_ID
-            )
-        """)
+        upsert(conn, 'team_boxscores', team_df)
 
         conn.commit()
-        conn.close()
 
         logging.info(f"Successfully updated boxscores for {self.city} in team_boxscores table")
         
@@ -238,7 +198,7 @@ class Team:
                 ]}
         """
         logging.info("Team Roster selected: %s", self.city)
-        roster = CommonTeamRoster(team_id=self.id, timeout=10).get_dict()
+        roster = fetch(CommonTeamRoster, team_id=self.id, timeout=10)
         roster_df = pl.DataFrame(
             roster['resultSets'][0]['rowSet'],
             schema=roster['resultSets'][0]['headers'],
@@ -251,6 +211,167 @@ class Team:
         
         return roster_df
 
+TEAM_GAME_LOG_MEASURES = ['Four Factors', 'Advanced', 'Base']
+TEAM_GAME_LOG_KEYS = ['GAME_ID','SEASON_YEAR','TEAM_ID','GAME_DATE','MATCHUP', 'TEAM_ABBREVIATION', 'WL','TEAM_NAME']
+
+
+def team_game_log_endpoint(measure_type : str) -> str:
+    """
+    Lake directory of a TeamGameLogs measure type, e.g. 'TeamGameLogs_FourFactors'.
+    """
+    return f"TeamGameLogs_{measure_type.replace(' ', '')}"
+
+
+def combine_team_game_logs(ff_df : pl.DataFrame, adv_df : pl.DataFrame, reg_df : pl.DataFrame) -> pl.DataFrame:
+    """
+    Joins raw Four Factors, Advanced and Base TeamGameLogs pulls into team_boxscores rows.
+    """
+    ff_df = ff_df.drop(["AVAILABLE_FLAG","MIN","GP_RANK","W_RANK","L_RANK","W_PCT_RANK","MIN_RANK"])
+    adv_df = adv_df.drop(["AVAILABLE_FLAG","MIN","GP_RANK","W_RANK","L_RANK","W_PCT_RANK","MIN_RANK","OREB_PCT","EFG_PCT","TM_TOV_PCT","OREB_PCT_RANK","TM_TOV_PCT_RANK","EFG_PCT_RANK"])
+    df = ff_df.join(adv_df,on=TEAM_GAME_LOG_KEYS,how="inner")
+
+    reg_df = reg_df.drop(["AVAILABLE_FLAG","MIN","GP_RANK","W_RANK","L_RANK","W_PCT_RANK","MIN_RANK"])
+    reg_df = reg_df.with_columns([
+        pl.when(pl.col('MATCHUP').str.contains('@', literal=True)).then(pl.lit('Away')).otherwise(pl.lit('Home')).alias('LOCATION'),
+        pl.col('MATCHUP').str.split(' ').list.get(2).alias('OPPONENT')
+    ])
+    return df.join(reg_df,on=TEAM_GAME_LOG_KEYS,how="inner")
+
+
+def league_team_game_logs(season : str = Season.current_season) -> pl.DataFrame:
+    """
+    Gets every team's game logs for a season with one league-wide TeamGameLogs call per
+    measure type, instead of three calls per team.
+
+    Parameters:
+        season (str): NBA season in format '2024-25'. Defaults to current season.
+
+    Returns:
+        pl.DataFrame: Same columns as Team.get_team_game_log so rows can be loaded into team_boxscores
+    """
+    logging.info(f"Getting league team game logs for {season}...")
+    frames = {}
+    for measure_type in TEAM_GAME_LOG_MEASURES:
+        stats = fetch(TeamGameLogs, measure_type_player_game_logs_nullable=measure_type, season_nullable=season, timeout=100)
+        frames[measure_type] = pl.DataFrame(stats['resultSets'][0]['rowSet'], schema=stats['resultSets'][0]['headers'], orient='row')
+        land(team_game_log_endpoint(measure_type), frames[measure_type], season=season)
+    return combine_team_game_logs(frames['Four Factors'], frames['Advanced'], frames['Base'])
+
+
+def create_league_team_boxscore_table(conn, season : str = Season.current_season):
+    """
+    Creates/updates the team_boxscores table for the whole league in one bulk upsert.
+    """
+    team_df = league_team_game_logs(season)
+    upsert(conn, 'team_boxscores', team_df)
+    conn.commit()
+    logging.info(f"Upserted {team_df.height} team boxscores for {season}")
+
+
+# Opponent features the points models use (plus DEF_RATING), and the windows they are averaged over
+OPPONENT_FEATURES = ['OPP_EFG_PCT', 'OPP_FTA_RATE', 'OPP_OREB_PCT', 'PACE', 'DEF_RATING']
+OPPONENT_FEATURE_WINDOWS = {'L5': 5, 'L10': 10, 'SEASON': None}
+
+
+def create_opponent_features_table(conn):
+    """
+    Creates/replaces opponent_features: one row per team with its OPPONENT_FEATURES averaged over
+    its last 5 and last 10 games and the whole season, e.g. OPP_EFG_PCT_L5, PACE_SEASON.
+
+    Games are numbered newest first with a window function over the latest season in
+    team_boxscores, and each window is a filtered average over those numbers. Inference reads
+    this table instead of calling LeagueDashTeamStats per prediction.
+    """
+    averages = ',\n            '.join(
+        f"AVG({feature}) FILTER (WHERE GAME_NUMBER <= {games}) AS {feature}_{window}" if games else f"AVG({feature}) AS {feature}_{window}"
+        for window, games in OPPONENT_FEATURE_WINDOWS.items()
+        for feature in OPPONENT_FEATURES
+    )
+    conn.execute(f"""
+        CREATE OR REPLACE TABLE opponent_features AS
+        WITH games AS (
+            SELECT
+                TEAM_ID, TEAM_ABBREVIATION, GAME_DATE,
+                {', '.join(f'CAST({feature} AS DOUBLE) AS {feature}' for feature in OPPONENT_FEATURES)},
+                ROW_NUMBER() OVER (PARTITION BY TEAM_ID ORDER BY GAME_DATE DESC, GAME_ID DESC) AS GAME_NUMBER
+            FROM team_boxscores
+            WHERE SEASON_YEAR = (SELECT MAX(SEASON_YEAR) FROM team_boxscores)
+        )
+        SELECT
+            TEAM_ID,
+            ANY_VALUE(TEAM_ABBREVIATION) AS TEAM_ABBREVIATION,
+            COUNT(*) AS GAMES,
+            MAX(GAME_DATE) AS LAST_GAME_DATE,
+            {averages}
+        FROM games
+        GROUP BY TEAM_ID
+    """)
+    conn.commit()
+    logging.info("Successfully built opponent_features...")
+
+
+def team_season_features(conn, season_ids : list[str]) -> pl.DataFrame:
+    """
+    Season averages of OPPONENT_FEATURES per team from team_boxscores, keyed the way
+    player_boxscores rows refer to opponents: OPPONENT (abbreviation) and SEASON_ID ('22023').
+
+    Returns an empty frame if team_boxscores doesn't exist yet.
+    """
+    try:
+        return conn.execute(f"""
+            SELECT
+                TEAM_ABBREVIATION AS OPPONENT,
+                '2' || LEFT(SEASON_YEAR, 4) AS SEASON_ID,
+                {', '.join(f'AVG(CAST({feature} AS DOUBLE)) AS {feature}' for feature in OPPONENT_FEATURES)}
+            FROM team_boxscores
+            WHERE '2' || LEFT(SEASON_YEAR, 4) IN (SELECT UNNEST(?::VARCHAR[]))
+            GROUP BY ALL
+        """, [season_ids]).pl()
+    except duckdb.CatalogException:
+        logging.warning("team_boxscores not found, team season features will come from the API")
+        return pl.DataFrame(schema={'OPPONENT': pl.String, 'SEASON_ID': pl.String, **{feature: pl.Float64 for feature in OPPONENT_FEATURES}})
+
+
+def league_team_season_features(season_id : str) -> pl.DataFrame:
+    """
+    Same columns as team_season_features for one season, from one league-wide Four Factors and
+    one Advanced LeagueDashTeamStats call.
+    """
+    season = Team.get_season(season_id)
+    four_factors_df = result_set(fetch(LeagueDashTeamStats, measure_type_detailed_defense='Four Factors', season=season, timeout=100))
+    advanced_df = result_set(fetch(LeagueDashTeamStats, measure_type_detailed_defense='Advanced', season=season, timeout=100))
+    abbreviations = {team_id: team.abbreviation for team_id, team in identity_index.teams_by_id.items()}
+    return (four_factors_df
+        .select('TEAM_ID', 'OPP_EFG_PCT', 'OPP_FTA_RATE', 'OPP_OREB_PCT')
+        .join(advanced_df.select('TEAM_ID', 'PACE', 'DEF_RATING'), on='TEAM_ID')
+        .select(
+            pl.col('TEAM_ID').replace_strict(abbreviations, default=None, return_dtype=pl.String).alias('OPPONENT'),
+            pl.lit(season_id).alias('SEASON_ID'),
+            *[pl.col(feature).cast(pl.Float64) for feature in OPPONENT_FEATURES]
+        )
+    )
+
+
+def read_opponent_features(conn, window : str = 'L5', team_id : int = None) -> pl.DataFrame:
+    """
+    Reads one window of opponent_features with the plain feature names (OPP_EFG_PCT, PACE, ...).
+
+    Parameters:
+        conn: DuckDB connection object
+        window (str): 'L5', 'L10' or 'SEASON'
+        team_id (int): only this team, every team by default
+
+    Returns:
+        pl.DataFrame: TEAM_ID and OPPONENT_FEATURES
+    """
+    if window not in OPPONENT_FEATURE_WINDOWS:
+        raise ValueError(f"Unknown opponent feature window: {window}")
+    columns = ', '.join(f"{feature}_{window} AS {feature}" for feature in OPPONENT_FEATURES)
+    if team_id is None:
+        return conn.execute(f"SELECT TEAM_ID, {columns} FROM opponent_features").pl()
+    return conn.execute(f"SELECT TEAM_ID, {columns} FROM opponent_features WHERE TEAM_ID = ?", [team_id]).pl()
+
+
 @lru_cache(maxsize=None)
 def abrv_team_dict(team : str):
     """
@@ -260,7 +381,7 @@ def abrv_team_dict(team : str):
     return ABRV_TEAM_DICT.get(team)
 
 def get_teams_opponent_stats(conn):
-    stats = LeagueDashTeamStats(measure_type_detailed_defense='Opponent',per_mode_detailed='PerGame', last_n_games='10').get_dict()
+    stats = fetch(LeagueDashTeamStats, measure_type_detailed_defense='Opponent',per_mode_detailed='PerGame', last_n_games='10')
     stats_df = pl.DataFrame(stats['resultSets'][0]['rowSet'], schema=stats['resultSets'][0]['headers'], orient='row')
     conn.execute("""
         CREATE OR REPLACE TABLE teams_opponent_stats AS 
@@ -269,7 +390,7 @@ def get_teams_opponent_stats(conn):
     conn.commit()
 
 def get_teams_defense_stats(conn):
-    stats = LeagueDashTeamStats(measure_type_detailed_defense='Defense',per_mode_detailed='PerGame', last_n_games='10').get_dict()
+    stats = fetch(LeagueDashTeamStats, measure_type_detailed_defense='Defense',per_mode_detailed='PerGame', last_n_games='10')
     stats_df = pl.DataFrame(stats['resultSets'][0]['rowSet'], schema=stats['resultSets'][0]['headers'], orient='row')
     conn.execute("""
         CREATE OR REPLACE TABLE teams_defense_stats AS 
@@ -278,7 +399,7 @@ def get_teams_defense_stats(conn):
     conn.commit()
 
 def get_teams_four_factors_stats(conn):
-    stats = LeagueDashTeamStats(measure_type_detailed_defense='Four Factors',per_mode_detailed='PerGame', last_n_games='10').get_dict()
+    stats = fetch(LeagueDashTeamStats, measure_type_detailed_defense='Four Factors',per_mode_detailed='PerGame', last_n_games='10')
     stats_df = pl.DataFrame(stats['resultSets'][0]['rowSet'], schema=stats['resultSets'][0]['headers'], orient='row')
     conn.execute("""
         CREATE OR REPLACE TABLE teams_four_factors_stats AS 
@@ -287,7 +408,7 @@ def get_teams_four_factors_stats(conn):
     conn.commit()
 
 def get_teams_advanced_stats(conn):
-    stats = LeagueDashTeamStats(measure_type_detailed_defense='Advanced',per_mode_detailed='PerGame', last_n_games='10').get_dict()
+    stats = fetch(LeagueDashTeamStats, measure_type_detailed_defense='Advanced',per_mode_detailed='PerGame', last_n_games='10')
     stats_df = pl.DataFrame(stats['resultSets'][0]['rowSet'], schema=stats['resultSets'][0]['headers'], orient='row')
     conn.execute("""
         CREATE OR REPLACE TABLE teams_advanced_stats AS 
@@ -311,16 +432,95 @@ def team_stats(conn, stats_type : str, table_name : str):
     3. Creates/replaces a table in the database with the stats data
     """
     logging.info(f"Getting teams {stats_type} stats...")
-    stats = LeagueDashTeamStats(measure_type_detailed_defense=stats_type,per_mode_detailed='PerGame', last_n_games='10').get_dict()
+    stats = fetch(LeagueDashTeamStats, measure_type_detailed_defense=stats_type,per_mode_detailed='PerGame', last_n_games='10')
     stats_df = pl.DataFrame(stats['resultSets'][0]['rowSet'], schema=stats['resultSets'][0]['headers'], orient='row')
+    land(team_stats_endpoint(stats_type), stats_df, season=Season.current_season)
+    conn.register('stats_df', stats_df)
     conn.execute(f"""
         CREATE OR REPLACE TABLE {table_name} AS 
         SELECT * FROM stats_df
     """)
+    conn.unregister('stats_df')
     conn.commit()
     logging.info(f"Successfully populated teams {stats_type} stats...")
 
 
+def league_roster(season : str = Season.current_season) -> pl.DataFrame:
+    """
+    Gets every rostered player in the league with a single CommonAllPlayers call, instead of
+    one CommonTeamRoster call per team.
 
+    Parameters:
+        season (str): NBA season in format '2024-25'. Defaults to current season.
+
+    Returns:
+        pl.DataFrame: PLAYER_ID, PLAYER, TEAM_ID, TEAM_ABBREVIATION and TEAM_CITY per rostered player
+    """
+    logging.info(f"Getting league roster for {season}...")
+    players = fetch(CommonAllPlayers, is_only_current_season=1, season=season, timeout=30)
+    players_df = pl.DataFrame(players['resultSets'][0]['rowSet'], schema=players['resultSets'][0]['headers'], orient='row')
+    land('CommonAllPlayers', players_df, season=season)
+    # Free agents come back with TEAM_ID 0
+    return (players_df
+        .filter(pl.col('TEAM_ID') != 0)
+        .select(
+            pl.col('PERSON_ID').alias('PLAYER_ID'),
+            pl.col('DISPLAY_FIRST_LAST').alias('PLAYER'),
+            'TEAM_ID',
+            'TEAM_ABBREVIATION',
+            'TEAM_CITY'
+        )
+    )
+
+
+def create_roster_snapshot_table(conn, roster_df : pl.DataFrame, run_id : str):
+    """
+    Stores the roster a pipeline run worked from in roster_snapshots, keyed on (RUN_ID, PLAYER_ID).
+    """
+    snapshot_df = roster_df.with_columns(
+        pl.lit(run_id).alias('RUN_ID'),
+        pl.lit(datetime.now()).alias('SNAPSHOT_AT')
+    )
+    upsert(conn, 'roster_snapshots', snapshot_df)
+    conn.commit()
+    logging.info(f"Stored roster snapshot of {snapshot_df.height} players for run {run_id}")
+
+
+# Columns served by the team defense endpoint, by the teams_*_stats table (alias) they come from
+TEAM_DEFENSE_PROFILE_COLUMNS = {
+    'o': ['OPP_FGA_RANK', 'OPP_FGA', 'OPP_FG_PCT_RANK', 'OPP_FG_PCT', 'OPP_FTA_RANK', 'OPP_FTA', 'OPP_FT_PCT_RANK', 'OPP_FT_PCT',
+          'OPP_REB_RANK', 'OPP_REB', 'OPP_AST_RANK', 'OPP_AST', 'OPP_FG3A_RANK', 'OPP_FG3A'],
+    'd': ['DEF_RATING_RANK', 'DEF_RATING', 'OPP_PTS_PAINT_RANK', 'OPP_PTS_PAINT'],
+    'a': ['PACE_RANK', 'PACE'],
+    'f': ['OPP_EFG_PCT_RANK', 'OPP_EFG_PCT', 'OPP_FTA_RATE_RANK', 'OPP_FTA_RATE', 'OPP_OREB_PCT_RANK', 'OPP_OREB_PCT'],
+}
+
+
+def create_team_defense_profile_table(conn):
+    """
+    Joins the four teams_*_stats tables into team_defense_profile, one typed row per team
+    holding exactly the columns the defense endpoint serves, so it needs a single lookup.
+    """
+    columns = ',\n            '.join(
+        f"{alias}.{column}::{'INTEGER' if column.endswith('_RANK') else 'DOUBLE'} AS {column}"
+        for alias, alias_columns in TEAM_DEFENSE_PROFILE_COLUMNS.items() for column in alias_columns
+    )
+    conn.execute(f"""
+        CREATE OR REPLACE TABLE team_defense_profile AS
+        SELECT
+            o.TEAM_ID::BIGINT AS TEAM_ID,
+            {columns}
+        FROM teams_opponent_stats o
+        JOIN teams_defense_stats d USING (TEAM_ID)
+        JOIN teams_four_factors_stats f USING (TEAM_ID)
+        JOIN teams_advanced_stats a USING (TEAM_ID)
+    """)
+    conn.commit()
+    logging.info("Successfully populated team defense profile...")
 
 
+def team_stats_endpoint(stats_type : str) -> str:
+    """
+    Lake directory of a LeagueDashTeamStats measure type, e.g. 'LeagueDashTeamStats_FourFactors'.
+    """
+    return f"LeagueDashTeamStats_{stats_type.replace(' ', '')}"
@@ -0,0 +1,140 @@
+import logging
+import threading
+import duckdb
+import polars as pl
+
+# Primary key of each warehouse table written by the pipelines
+TABLE_KEYS = {
+    'player_boxscores': ['Game_ID', 'Player_ID'],
+    'player_headline_stats': ['PLAYER_ID'],
+    'player_shooting_splits': ['PLAYER_ID'],
+    'team_boxscores': ['GAME_ID', 'TEAM_ID'],
+    'roster_snapshots': ['RUN_ID', 'PLAYER_ID'],
+    'player_rolling_features': ['Game_ID', 'Player_ID'],
+}
+
+# Single-row table holding the generation of the warehouse data, bumped by each pipeline run
+DATA_VERSION_TABLE = 'data_version'
+
+_table_locks = {}
+_table_locks_lock = threading.Lock()
+
+
+def table_lock(table_name : str) -> threading.Lock:
+    """
+    Lock serializing writes to one table from concurrent tasks. DuckDB rejects concurrent
+    creates and overlapping writes to the same table as transaction conflicts.
+    """
+    with _table_locks_lock:
+        return _table_locks.setdefault(table_name, threading.Lock())
+
+
+def upsert(conn, table_name : str, df : pl.DataFrame, key : list[str] = None) -> int:
+    """
+    Inserts df into table_name, replacing rows that share its primary key, in one round trip.
+
+    The table is created from df's schema if it doesn't exist. Rows are matched on key
+    (defaults to TABLE_KEYS[table_name]) with DELETE ... USING followed by INSERT ... BY NAME
+    inside a single transaction, which works on tables created with CREATE TABLE AS that
+    have no primary key constraint for INSERT OR REPLACE to use.
+
+    Parameters:
+        conn: DuckDB connection object
+        table_name (str): table to write
+        df (pl.DataFrame): rows to upsert
+        key (list[str]): columns identifying a row
+
+    Returns:
+        int: number of rows written
+    """
+    if df.is_empty():
+        return 0
+    key = key or TABLE_KEYS[table_name]
+    staged = df.unique(subset=key, keep='last', maintain_order=True)
+    view_name = f"staged_{table_name}"
+    match = ' AND '.join(f"t.{column} = s.{column}" for column in key)
+    conn.register(view_name, staged)
+    try:
+        with table_lock(table_name):
+            conn.execute(f"""
+                BEGIN TRANSACTION;
+                CREATE TABLE IF NOT EXISTS {table_name} AS SELECT * FROM {view_name} WHERE 1=0;
+                DELETE FROM {table_name} t USING {view_name} s WHERE {match};
+                INSERT INTO {table_name} BY NAME SELECT * FROM {view_name};
+                COMMIT;
+            """)
+    except Exception:
+        try:
+            conn.execute("ROLLBACK")
+        except duckdb.TransactionException:
+            # Failed before BEGIN took effect, there is nothing to roll back
+            pass
+        raise
+    finally:
+        conn.unregister(view_name)
+    logging.info(f"Upserted {staged.height} rows into {table_name}")
+    return staged.height
+
+
+class BulkUpserter:
+    """
+    Collects frames for many tables (a team, or the whole league) and writes each table with one upsert.
+
+    stage() is thread-safe so fetch workers can stage results as they finish.
+
+    Example:
+        upserter = BulkUpserter()
+        upserter.stage('player_headline_stats', headline_df)
+        upserter.flush(conn)
+    """
+    def __init__(self) -> None:
+        self.staged = {}
+        self.lock = threading.Lock()
+
+    def stage(self, table_name : str, df : pl.DataFrame):
+        with self.lock:
+            self.staged.setdefault(table_name, []).append(df)
+
+    def flush(self, conn) -> dict[str, int]:
+        """
+        Upserts everything staged so far, one statement per table.
+
+        Returns:
+            dict[str, int]: rows written per table
+        """
+        with self.lock:
+            staged, self.staged = self.staged, {}
+        written = {}
+        for table_name, frames in staged.items():
+            df = pl.concat(frames, how='diagonal_relaxed')
+            written[table_name] = upsert(conn, table_name, df)
+        return written
+
+
+def get_data_version(conn) -> int:
+    """
+    Returns the current data generation, 0 if the pipelines never bumped it.
+    """
+    try:
+        row = conn.execute(f"SELECT GENERATION FROM {DATA_VERSION_TABLE}").fetchone()
+    except duckdb.CatalogException:
+        return 0
+    return row[0] if row else 0
+
+
+def bump_data_version(conn) -> int:
+    """
+    Advances the data generation once a pipeline run has finished writing, so API response
+    caches drop entries computed from the previous data.
+    """
+    with table_lock(DATA_VERSION_TABLE):
+        conn.execute(f"""
+            BEGIN TRANSACTION;
+            CREATE TABLE IF NOT EXISTS {DATA_VERSION_TABLE} (GENERATION BIGINT NOT NULL, UPDATED_AT TIMESTAMP);
+            INSERT INTO {DATA_VERSION_TABLE} SELECT 0, current_timestamp WHERE NOT EXISTS (SELECT 1 FROM {DATA_VERSION_TABLE});
+            UPDATE {DATA_VERSION_TABLE} SET GENERATION = GENERATION + 1, UPDATED_AT = current_timestamp;
+            COMMIT;
+        """)
+    generation = get_data_version(conn)
+    logging.info(f"Bumped data version to {generation}")
+    return generation
@@ -0,0 +1,110 @@
+import logging
+from datetime import date
+import polars as pl
+from warehouse import table_lock
+
+WATERMARK_TABLE = 'ingest_watermarks'
+
+# PLAYER_ID used for the league-wide watermark of a table
+LEAGUE = 0
+
+# GAME_DATE as returned by PlayerGameLog, e.g. 'APR 14, 2024'
+GAME_DATE = pl.col('GAME_DATE').str.to_date('%b %d, %Y')
+
+
+def ensure_watermark_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (
+            TABLE_NAME VARCHAR NOT NULL,
+            PLAYER_ID BIGINT NOT NULL,
+            LAST_GAME_DATE DATE NOT NULL,
+            LAST_GAME_ID VARCHAR NOT NULL,
+            UPDATED_AT TIMESTAMP DEFAULT current_timestamp,
+            PRIMARY KEY (TABLE_NAME, PLAYER_ID)
+        )
+    """)
+
+
+def get_watermark(conn, table_name : str, player_id : int = LEAGUE) -> date | None:
+    """
+    Returns the last ingested game date for a player (or the league), None if nothing was ingested yet.
+    """
+    ensure_watermark_table(conn)
+    row = conn.execute(f"""
+        SELECT LAST_GAME_DATE FROM {WATERMARK_TABLE}
+        WHERE TABLE_NAME = ? AND PLAYER_ID = ?
+    """, [table_name, player_id]).fetchone()
+    return row[0] if row else None
+
+
+def get_watermarks(conn, table_name : str) -> dict[int, date]:
+    """
+    Returns every player's watermark for a table in one query.
+    """
+    ensure_watermark_table(conn)
+    rows = conn.execute(f"""
+        SELECT PLAYER_ID, LAST_GAME_DATE FROM {WATERMARK_TABLE}
+        WHERE TABLE_NAME = ? AND PLAYER_ID <> ?
+    """, [table_name, LEAGUE]).fetchall()
+    return dict(rows)
+
+
+def api_date(watermark : date | None) -> str:
+    """
+    Formats a watermark for nba_api date_from_nullable params ('MM/DD/YYYY'), '' for no watermark.
+    """
+    return watermark.strftime('%m/%d/%Y') if watermark else ""
+
+
+def filter_new_games(conn, table_name : str, df : pl.DataFrame) -> pl.DataFrame:
+    """
+    Keeps only the rows played after each player's watermark.
+
+    Comparing against the small watermark table (one row per player) replaces the
+    anti-join against every row already in the warehouse table.
+    """
+    ensure_watermark_table(conn)
+    marks = conn.execute(f"""
+        SELECT PLAYER_ID AS Player_ID, LAST_GAME_DATE FROM {WATERMARK_TABLE}
+        WHERE TABLE_NAME = ? AND PLAYER_ID <> ?
+    """, [table_name, LEAGUE]).pl()
+    return (df
+        .join(marks.cast({'Player_ID': df.schema['Player_ID']}), on='Player_ID', how='left')
+        .filter(pl.col('LAST_GAME_DATE').is_null() | (GAME_DATE > pl.col('LAST_GAME_DATE')))
+        .drop('LAST_GAME_DATE')
+    )
+
+
+def update_watermarks(conn, table_name : str, df : pl.DataFrame, league : bool = False):
+    """
+    Advances the watermark of every player in df, and the league watermark when league is True.
+    Watermarks only move forward, so backfilling an older date range keeps incremental runs
+    starting from the newest game already loaded.
+    """
+    if df.is_empty():
+        return
+    ensure_watermark_table(conn)
+    marks = (df
+        .group_by('Player_ID')
+        .agg(GAME_DATE.max().alias('LAST_GAME_DATE'), pl.col('Game_ID').max().alias('LAST_GAME_ID'))
+        .select(pl.lit(table_name).alias('TABLE_NAME'), pl.col('Player_ID').cast(pl.Int64).alias('PLAYER_ID'), 'LAST_GAME_DATE', 'LAST_GAME_ID')
+    )
+    if league:
+        marks = pl.concat([marks, marks.select(
+            pl.lit(table_name).alias('TABLE_NAME'),
+            pl.lit(LEAGUE, dtype=pl.Int64).alias('PLAYER_ID'),
+            pl.col('LAST_GAME_DATE').max(),
+            pl.col('LAST_GAME_ID').max()
+        )])
+    conn.register('new_watermarks', marks)
+    with table_lock(WATERMARK_TABLE):
+        conn.execute(f"""
+            INSERT INTO {WATERMARK_TABLE} (TABLE_NAME, PLAYER_ID, LAST_GAME_DATE, LAST_GAME_ID)
+            SELECT TABLE_NAME, PLAYER_ID, LAST_GAME_DATE, LAST_GAME_ID FROM new_watermarks
+            ON CONFLICT (TABLE_NAME, PLAYER_ID) DO UPDATE SET
+                LAST_GAME_DATE = greatest(LAST_GAME_DATE, excluded.LAST_GAME_DATE),
+                LAST_GAME_ID = CASE WHEN excluded.LAST_GAME_DATE > LAST_GAME_DATE THEN excluded.LAST_GAME_ID ELSE LAST_GAME_ID END,
+                UPDATED_AT = now()
+        """)
+    conn.unregister('new_watermarks')
+    logging.info(f"Advanced {table_name} watermarks for {marks.height} players")